@@ -1,14 +1,198 @@
 import sys
 import os
+import time
 import sublime
-from subprocess import Popen, PIPE
 from decimal import Decimal
 import math
 
 try:
     from Rdio.singleton import Singleton
+    from Rdio.osascript import OsascriptCoprocess, run_script
+    from Rdio.perf import timed
+    from Rdio.launch_watcher import LaunchWatcher
+    from Rdio.transport_queue import TransportQueue, PAUSE, TOGGLE
 except:
     from singleton import Singleton
+    from osascript import OsascriptCoprocess, run_script
+    from perf import timed
+    from launch_watcher import LaunchWatcher
+    from transport_queue import TransportQueue, PAUSE, TOGGLE
+
+sublime3 = int(sublime.version()) >= 3000
+if sublime3:
+    set_timeout_async = sublime.set_timeout_async
+else:
+    set_timeout_async = sublime.set_timeout
+
+# Fields are joined with the ASCII unit separator, which can't appear in
+# track metadata, so names containing ", " come back intact.
+FIELD_SEPARATOR = "\x1f"
+
+def applescript_string(text):
+    """ text as an AppleScript string literal. """
+    return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+class Transaction():
+    """
+    Reads and actions to run in the Rdio app as one script, so they cost one round trip.
+
+    read(expression) adds an Rdio expression to evaluate and returns the index of its value
+    in the results. act(statement) adds a statement to run, and act(statement, unless=condition)
+    one to run only if condition is false when it's reached. Everything runs in the order it
+    was added. An expression that fails evaluates to "", and a condition that fails (e.g.
+    about the current track, when there isn't one yet) is false. Comparisons consider case,
+    which AppleScript's don't by default.
+
+        transaction = Transaction()
+        playing = transaction.read('key of current track is "t123"')
+        transaction.act('play source "t123"', unless='key of current track is "t123"')
+        results = player.run_transaction(transaction) # None if Rdio isn't running
+        results[playing] == "true"
+
+    The script returns "true" followed by the values read, joined by FIELD_SEPARATOR, or
+    just "false" if Rdio isn't running. With launch, it also launches Rdio in that case.
+    """
+    def __init__(self, launch=False):
+        self.launch = launch
+        self.acts = launch
+        self.reads = 0
+        self._lines = []
+
+    def read(self, expression):
+        self._lines += ['\ttry',
+                        '\t\tset end of fields to (({}) as string)'.format(expression),
+                        '\ton error',
+                        '\t\tset end of fields to ""',
+                        '\tend try']
+        self.reads += 1
+        return self.reads - 1
+
+    def act(self, statement, unless=None):
+        self.acts = True
+        if unless is None:
+            self._lines.append('\t' + statement)
+        else:
+            self._lines += ['\tset conditionMet to false',
+                            '\ttry',
+                            '\t\tset conditionMet to ({})'.format(unless),
+                            '\tend try',
+                            '\tif not conditionMet then',
+                            '\t\t' + statement,
+                            '\tend if']
+
+    def script(self):
+        if self.launch:
+            lines = ['if application "Rdio" is not running then',
+                     '\ttell application "Rdio" to launch',
+                     '\treturn "false"',
+                     'end if']
+        else:
+            lines = ['if application "Rdio" is not running then return "false"']
+        lines += ['set fields to {"true"}',
+                  'considering case',
+                  'tell application "Rdio"']
+        lines += self._lines
+        lines += ['end tell',
+                  'end considering',
+                  'set AppleScript\'s text item delimiters to character id 31',
+                  'return fields as string']
+        return "\n".join(lines)
+
+    def parse(self, result):
+        """
+        The values read, from the script's output, or None if Rdio isn't running.
+        Raises ValueError if they can't be told apart (a value contained FIELD_SEPARATOR).
+        """
+        fields = result.split(FIELD_SEPARATOR)
+        if fields[0] != "true":
+            return None
+        if len(fields) != self.reads + 1:
+            raise ValueError("Expected {} values, got {}".format(self.reads, len(fields) - 1))
+        return fields[1:]
+
+def fields_script(expressions):
+    """
+    Build a script that evaluates each of the given Rdio expressions and returns
+    "true" followed by their values joined by FIELD_SEPARATOR, or just "false"
+    if Rdio isn't running. An expression that fails evaluates to "".
+    """
+    transaction = Transaction()
+    for expression in expressions:
+        transaction.read(expression)
+    return transaction.script()
+
+SNAPSHOT_FIELDS = ["player state", "shuffle", "key of current track",
+    "duration of current track", "artist of current track", "album of current track",
+    "name of current track", "player position"]
+SNAPSHOT_SCRIPT = fields_script(SNAPSHOT_FIELDS)
+PROBE_SCRIPT = fields_script(["player state", "key of current track"])
+POSITION_PROBE_SCRIPT = fields_script(["player state", "key of current track",
+    "duration of current track", "player position"])
+
+# How long to keep trying to play something, in seconds, and how long to wait
+# before checking that it worked (doubling after each check, up to the max).
+# Checks only look, unless it's been PLAY_RESEND_INTERVAL since it was last asked
+# for: Rdio takes a while to switch, and asking again would start it over.
+PLAY_TIMEOUT = 60.0
+PLAY_CHECK_DELAY = 0.1
+PLAY_MAX_CHECK_DELAY = 2.0
+PLAY_RESEND_INTERVAL = 1.0
+
+def _to_float(numstr):
+    # Reals are coerced to text using the system's decimal separator.
+    return float(numstr.replace(",", "."))
+
+def _parse_duration(numstr):
+    try:
+        return int(_to_float(numstr))
+    except ValueError:
+        return 0
+
+def convert_position(numstr, duration):
+    """ Convert Rdio's position, a percent of the total duration, to seconds. """
+    try:
+        percent = _to_float(numstr)
+    except ValueError:
+        return 0
+    decimalSeconds = Decimal((percent/100.0) * duration)
+    if math.isnan(decimalSeconds): return 0
+    return round(decimalSeconds)
+
+class PlayerSnapshot():
+    """ The state of the Rdio app and its current track, fetched with a single script. """
+    def __init__(self, running=False, state="", shuffle=False, key="", duration=0,
+                 artist="", album="", song="", position=0):
+        self.running = running
+        self.state = state
+        self.shuffle = shuffle
+        self.key = key
+        self.duration = duration
+        self.artist = artist
+        self.album = album
+        self.song = song
+        self.position = position
+        self.fetched_at = time.monotonic()
+
+    @classmethod
+    def parse(cls, result):
+        """
+        Build a snapshot from the output of SNAPSHOT_SCRIPT.
+        Returns None if Rdio is running but the fields can't be told apart.
+        """
+        fields = result.split(FIELD_SEPARATOR)
+        if fields[0] != "true":
+            return cls()
+        if len(fields) != len(SNAPSHOT_FIELDS) + 1:
+            return None
+        return cls.from_fields(fields[1:])
+
+    @classmethod
+    def from_fields(cls, fields):
+        """ Build a snapshot of a running player from the values of SNAPSHOT_FIELDS. """
+        state, shuffle, key, duration, artist, album, song, position = fields
+        duration = _parse_duration(duration)
+        return cls(running=True, state=state, shuffle=(shuffle == "true"), key=key, duration=duration,
+                   artist=artist, album=album, song=song, position=convert_position(position, duration))
 
 # Wrap player interactions to compensate for different naming styles and platforms.
 @Singleton
@@ -22,15 +206,77 @@ class AppleScriptRdioPlayer():
             raise NotImplementedError("Sorry, your platform is not supported yet.")
         self.status_updater = None
 
+        s = sublime.load_settings("Rdio.sublime-settings")
+        self.snapshot_ttl = s.get("player_snapshot_ttl", 250) / 1000.0
+        self._snapshot = None
+        self.stats = {"snapshots": 0, "slow_snapshots": 0}
+
+        self.osascript_command = s.get("osascript_command", ["osascript"])
+        self.coprocess = None
+        if s.get("persistent_osascript", True):
+            self.coprocess = OsascriptCoprocess(self.osascript_command)
+
+        self.launch_watcher = LaunchWatcher(lambda: self.probe().running,
+            lambda: self.run_transaction(Transaction(launch=True)) is not None)
+        self._play_intent = None # (statement, condition) of the latest play, until it has worked
+
+        self.transport = TransportQueue(self._run_transport, s.get("transport_coalesce_period", 100) / 1000.0)
+
+    def snapshot(self):
+        """
+        Return a PlayerSnapshot of the Rdio app, fetching a new one only if
+        the cached one is older than the player_snapshot_ttl setting.
+        """
+        snapshot = self._snapshot
+        if snapshot is None or time.monotonic() - snapshot.fetched_at > self.snapshot_ttl:
+            self.stats["snapshots"] += 1
+            snapshot = PlayerSnapshot.parse(self._execute_command(SNAPSHOT_SCRIPT))
+            if snapshot is None:
+                snapshot = self._get_snapshot_field_by_field()
+            self._snapshot = snapshot
+        return snapshot
+
+    def _get_snapshot_field_by_field(self):
+        """
+        Slow path for when the fields of a snapshot can't be told apart (only possible if
+        a value contains FIELD_SEPARATOR). Query each field on its own instead.
+        """
+        self.stats["slow_snapshots"] += 1
+        fields = []
+        for expression in SNAPSHOT_FIELDS:
+            result = self._execute_command(fields_script([expression]))
+            if not result.startswith("true" + FIELD_SEPARATOR):
+                return PlayerSnapshot()
+            fields.append(result.split(FIELD_SEPARATOR, 1)[1])
+        return PlayerSnapshot.from_fields(fields)
+
+    def probe(self, include_position=False):
+        """
+        Return a PlayerSnapshot with only running, state and key (plus duration and
+        position if include_position) filled in. This is cheaper than a full
+        snapshot and is meant for noticing when the track changes.
+        """
+        fields = self._execute_command(POSITION_PROBE_SCRIPT if include_position else PROBE_SCRIPT).split(FIELD_SEPARATOR)
+        if fields[0] != "true" or len(fields) < 3:
+            return PlayerSnapshot()
+        if len(fields) != 5:
+            return PlayerSnapshot(running=True, state=fields[1], key=fields[2])
+        _, state, key, duration, position = fields
+        duration = _parse_duration(duration)
+        return PlayerSnapshot(running=True, state=state, key=key, duration=duration,
+                              position=convert_position(position, duration))
+
+    def invalidate_snapshot(self):
+        self._snapshot = None
+
     def is_running(self):
-        res = self._execute_command('get running of application "Rdio"')
-        return res == "true"
+        return self.snapshot().running
 
     def show_status_message(self):
         self.status_updater.run()
 
     def _get_state(self):
-        return self._execute_command('tell application "Rdio" to player state')
+        return self.snapshot().state
 
     def is_playing(self):
         return self._get_state() == "playing"
@@ -43,152 +289,176 @@ class AppleScriptRdioPlayer():
     def is_paused(self):
         return self._get_state() == "paused"
 
+    def is_shuffled(self):
+        return self.snapshot().shuffle
+
     # Current Track information
     def get_artist(self):
-        return self._execute_command('tell application "Rdio" to artist of current track')
+        return self.snapshot().artist
 
     def get_album(self):
-        return self._execute_command('tell application "Rdio" to album of current track')
+        return self.snapshot().album
 
     def get_song(self):
-        return self._execute_command('tell application "Rdio" to name of current track')
+        return self.snapshot().song
 
     def get_current_track(self):
         """
         Return an dict with keys "artist","album","duration","song","position" for the currently playing song.
-        All with only one shell command.
-        """
-        result_str = self._execute_command('tell application "Rdio" to get {duration,artist,album,name} of current track & player position')
-        try:
-            duration, artist, album, name, position = result_str.split(", ")
-            duration = int(float(duration))
-            position = self._convert_position(position, duration)
-        except ValueError:
-            # If there's a comma in the any of the fields, there's no way to differentiate the fields
-            # and a value error is thrown. In this case, just get them piece by piece.
-            duration = self.get_duration()
-            artist = self.get_artist()
-            name = self.get_song()
-            album = self.get_album()
-            position = self.get_position()
-        return {"duration":duration, "artist":artist, "album":album, "song":name, "position":position}
+        All with only one shell command, even if the metadata contains commas. See stats["slow_snapshots"]
+        for how often that isn't possible.
+        """
+        snapshot = self.snapshot()
+        return {"duration":snapshot.duration, "artist":snapshot.artist, "album":snapshot.album,
+                "song":snapshot.song, "position":snapshot.position}
 
     def _get_track_key(self):
-        return self._execute_command('tell application "Rdio" to key of current track')
+        return self.snapshot().key
 
     def get_position(self):
         """ Return current position in seconds. """
-        numstr = self._execute_command('tell application "Rdio" to player position')
-        return self._convert_position(numstr, self.get_duration())
-
-    def _convert_position(self, numstr, duration):
-        # Rdio returns position as a percent of the total durantion.
-        percent = float(numstr)
-        decimalSeconds = Decimal((percent/100.0) * duration)
-        if math.isnan(decimalSeconds): return 0
-        return round(decimalSeconds)
+        return self.snapshot().position
 
     def get_duration(self):
-        numstr = self._execute_command('tell application "Rdio" to duration of current track')
-        return int(float(numstr))
+        return self.snapshot().duration
 
     # Actions
     def play_pause(self):
-        self._execute_command('tell application "Rdio" to playpause')
+        self._play_intent = None
+        self.transport.playback(TOGGLE)
 
-    def play_album(self, album_key, album_name, attempts=0):
+    def play_album(self, album_key, album_name):
         """
         Play the album with Rdio key, album_key, launching the Rdio app if necessary.
 
         For a more detailed explanation see :py:func`play_track`.
         """
-        MAX_ATTEMPTS = 50
-        MILLIS_BETWEEN_ATTEMPTS = 1000
-        if attempts > MAX_ATTEMPTS: return
+        self._play_when_ready('play source "{}"'.format(album_key),
+                              'album of current track is ' + applescript_string(album_name))
 
-        if not self.is_running():
-            self._execute_command('tell application "Rdio" to launch')
-
-        if not self.is_running() or (self.get_album() != album_name):
-            self._execute_command('tell application "Rdio" to play source "{}"'.format(album_key))
-            sublime.set_timeout(lambda: self.play_album(album_key, album_name, attempts+1), MILLIS_BETWEEN_ATTEMPTS)
-        else:
-            self.show_status_message()
-
-    def play_track(self, track_key, attempts=0):
+    def play_track(self, track_key):
         """
         Play the track with Rdio key, track_key, launching the Rdio app if necessary.
 
-        If the Rdio app is not launched, this will attempt to launch it and
-        then will attempt to play track_key repeatedly until the Rdio app plays it
-        or until the maximum number of attempts are exhausted.
+        If the Rdio app is not launched, this will launch it and wait until it's running
+        before telling it to play track_key, then check that it did, telling it again
+        until it plays it or PLAY_TIMEOUT seconds pass.
 
         These extra steps are required because telling the Rdio app to play a song
         when it is not launched will silently fail. Additionally, if the Rdio app
         has just finished launching it may play the previously playing song instead
         of the requested one - again silently failing.
 
-        The MAX_ATTEMPTS may seem high, but occasionally the app takes ~40 seconds to launch,
-        at least on my machine. A high number shouldn't have a negative effect unless the app
-        is immediately quit, in which case it may relaunch.
+        The timeout may seem long, but occasionally the app takes ~40 seconds to launch,
+        at least on my machine.
         """
-        MAX_ATTEMPTS = 50
-        MILLIS_BETWEEN_ATTEMPTS = 1000
-        if attempts > MAX_ATTEMPTS: return
-
-        if not self.is_running():
-            self._execute_command('tell application "Rdio" to launch')
+        self._play_when_ready('play source "{}"'.format(track_key),
+                              'key of current track is "{}"'.format(track_key))
 
-        if not self.is_running() or (self._get_track_key() != track_key):
-            self._execute_command('tell application "Rdio" to play source "{}"'.format(track_key))
-            sublime.set_timeout(lambda: self.play_track(track_key, attempts+1), MILLIS_BETWEEN_ATTEMPTS)
-        else:
-            self.show_status_message()
-
-    def play(self, attempts=0):
+    def play(self):
         """
         Play the current track, launching the Rdio app if necessary.
 
         For a more detailed explanation see :py:func`play_track`.
         """
-        MAX_ATTEMPTS = 50
-        MILLIS_BETWEEN_ATTEMPTS = 1000
-        if attempts > MAX_ATTEMPTS: return
+        self.transport.clear_playback()
+        self._play_when_ready('play', 'player state is playing')
 
-        if not self.is_running():
-            self._execute_command('tell application "Rdio" to launch')
+    def _play_when_ready(self, statement, condition):
+        """
+        Once launch_watcher says Rdio is ready, run statement until the AppleScript
+        condition says it worked. This replaces any earlier play that hasn't worked
+        yet, so asking for several things while Rdio launches plays only the last
+        of them, once.
+        """
+        intent = self._play_intent = (statement, condition)
+        self.launch_watcher.ready().add_done_callback(lambda ready: self._play_intent_when_ready(intent, ready))
 
-        if not self.is_running() or not self.is_playing():
-            self._execute_command('tell application "Rdio" to play')
-            sublime.set_timeout(lambda: self.play(attempts+1), MILLIS_BETWEEN_ATTEMPTS)
-        else:
+    def _play_intent_when_ready(self, intent, ready):
+        if not ready.result(): return
+        self._check_play_intent(intent, time.monotonic() + PLAY_TIMEOUT, PLAY_CHECK_DELAY, None)
+
+    def _try_play_intent(self, intent, resend):
+        """
+        Check whether intent has worked and, if resend, play it again if not, with one script.
+        Returns whether it had.
+        """
+        statement, condition = intent
+        transaction = Transaction()
+        done = transaction.read(condition)
+        if resend:
+            transaction.act(statement, unless=condition)
+        results = self.run_transaction(transaction)
+        return results is not None and results[done] == "true"
+
+    def _check_play_intent(self, intent, deadline, delay, sent_at):
+        if self._play_intent is not intent: return
+        now = time.monotonic()
+        resend = sent_at is None or now - sent_at >= PLAY_RESEND_INTERVAL
+        if self._try_play_intent(intent, resend):
+            self._play_intent = None
             self.show_status_message()
+        elif now < deadline:
+            if resend: sent_at = now
+            next_delay = min(delay * 2, PLAY_MAX_CHECK_DELAY)
+            set_timeout_async(lambda: self._check_play_intent(intent, deadline, next_delay, sent_at), int(delay * 1000))
+        else:
+            self._play_intent = None
 
     def pause(self):
-        self._execute_command('tell application "Rdio" to pause')
+        self._play_intent = None
+        self.transport.playback(PAUSE)
 
     def next(self):
-        self._execute_command('tell application "Rdio" to next track')
-        self.show_status_message()
+        self._play_intent = None
+        self.transport.skip(1)
 
     def previous(self):
-        # Call it twice - once to get back to the beginning
-        # of this song and once to go back to the next.
-        # This works poorly for Rdio. TODO: fix it.
-        self._execute_command('tell application "Rdio" to previous track')
-        self._execute_command('tell application "Rdio" to previous track')
-        self.show_status_message()
-
-    def toggle_shuffle(self):
-        if self._execute_command('tell application "Rdio" to shuffle') == "true":
-            self._execute_command('tell application "Rdio" to set shuffle to false')
+        self._play_intent = None
+        self.transport.skip(-1)
+
+    def _run_transport(self, skip, playback):
+        """ Run what transport coalesced the recent transport commands into, as one script. """
+        if skip > 0:
+            statements = ["next track"] * skip
+        elif skip < 0:
+            # One extra - the first gets back to the beginning of this song
+            # and the rest go back a song each.
+            # This works poorly for Rdio. TODO: fix it.
+            statements = ["previous track"] * (1 - skip)
         else:
-            self._execute_command('tell application "Rdio" to set shuffle to true')
+            statements = []
+        if playback:
+            statements.append(playback)
+        transaction = Transaction()
+        for statement in statements:
+            transaction.act(statement)
+        self.run_transaction(transaction)
+        if skip:
+            self.show_status_message()
 
+    def toggle_shuffle(self):
+        transaction = Transaction()
+        transaction.act("set shuffle to not shuffle")
+        self.run_transaction(transaction)
+
+    def run_transaction(self, transaction):
+        """ Run a Transaction as one script. Returns the values it read, or None if Rdio isn't running. """
+        script = transaction.script()
+        result = self._execute_action(script) if transaction.acts else self._execute_command(script)
+        return transaction.parse(result)
+
+    def _execute_action(self, cmd):
+        """ Run a command that changes the player's state. """
+        result = self._execute_command(cmd)
+        self.invalidate_snapshot()
+        if self.status_updater:
+            self.status_updater.wake()
+        return result
+
+    @timed("AppleScriptRdioPlayer._execute_command")
     def _execute_command(self, cmd):
-        stdout = ""
-        if cmd != "":
-            bytes_cmd = cmd.encode('latin-1')
-            p = Popen(['osascript', '-'], stdin=PIPE, stdout=PIPE, stderr=PIPE)
-            stdout, stderr = p.communicate(bytes_cmd)
-        return stdout.decode('utf-8').strip()
+        if cmd == "": return ""
+        if self.coprocess:
+            return self.coprocess.execute(cmd)
+        return run_script(cmd, self.osascript_command)
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Fire identical API calls from several threads at once and count what reaches the server.
+
+  python3 benchmarks/bench_coalescing.py [threads] [request latency ms]
+"""
+import sys
+import threading
+import time
+
+import env
+env.setup()
+
+from mock_rdio_server import MockRdioServer
+from Rdio.rdio import Rdio, singleflight
+
+def main(threads, latency):
+    server = MockRdioServer(latency=latency).start()
+    Rdio.api_root = server.url
+    results = []
+    def call(params):
+        results.append(Rdio(("key", "secret")).call("get", params))
+
+    # The same call with its params in different orders, plus one different call.
+    params = [{"keys": "a1", "extras": "tracks"}, {"extras": "tracks", "keys": "a1"}] * (threads // 2) + [{"keys": "a2"}]
+    workers = [threading.Thread(target=call, args=(p,)) for p in params]
+    start = time.perf_counter()
+    for w in workers: w.start()
+    for w in workers: w.join()
+    elapsed = time.perf_counter() - start
+    server.stop()
+
+    assert len(results) == len(params)
+    print("calls made:        %d" % len(params))
+    print("requests received: %d" % server.counts["requests"])
+    print("coalesced calls:   %d" % singleflight.stats["coalesced"])
+    print("elapsed:           %.1f ms" % (elapsed * 1000))
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 10, float(args[1]) / 1000 if len(args) > 1 else 0.05)
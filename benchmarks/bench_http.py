@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Compare a new connection per API call (urlopen) with the shared keep-alive pool.
+
+  python3 benchmarks/bench_http.py [calls] [connect latency ms] [request latency ms]
+"""
+import sys
+import time
+
+import env
+env.setup()
+
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from mock_rdio_server import MockRdioServer
+from Rdio.om import om
+from Rdio.rdio import Rdio, connection_pool
+
+CONSUMER = ("key", "secret")
+
+def call_with_urlopen(url, params):
+    # What Rdio.call used to do.
+    auth = om(CONSUMER, url, params)
+    req = Request(url, urlencode(params).encode('utf-8'),
+                  {'Authorization': auth, 'Content-Type': 'application/x-www-form-urlencoded;charset=utf-8'})
+    return urlopen(req).read().decode('utf-8')
+
+def bench(call, calls):
+    start = time.perf_counter()
+    for i in range(calls):
+        call({"method": "searchSuggestions", "query": "artist %d" % (i % 20)})
+    return (time.perf_counter() - start) / calls
+
+def main(calls, connect_latency, latency):
+    server = MockRdioServer(latency=latency, connect_latency=connect_latency).start()
+    Rdio.api_root = server.url
+    try:
+        url = server.url + "/1/"
+        per_connection = bench(lambda params: call_with_urlopen(url, params), calls)
+        urlopen_connections = server.counts["connections"]
+
+        server.reset_counts()
+        rdio = Rdio(CONSUMER)
+        pooled = bench(lambda params: rdio.call(params.pop("method"), params), calls)
+        pooled_connections = server.counts["connections"]
+    finally:
+        server.stop()
+
+    stats = connection_pool.stats
+    print("calls: %d, connect latency %.0f ms, request latency %.0f ms" % (calls, connect_latency * 1000, latency * 1000))
+    print("urlopen:   %7.2f ms/call, %d connections" % (per_connection * 1000, urlopen_connections))
+    print("pool:      %7.2f ms/call, %d connections" % (pooled * 1000, pooled_connections))
+    print("gzip:      %d bytes on the wire for %d bytes of JSON" % (stats["bytes_received"], stats["bytes_decoded"]))
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 200,
+         float(args[1]) / 1000 if len(args) > 1 else 0.02,
+         float(args[2]) / 1000 if len(args) > 2 else 0.0)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Compare showing an album's tracks with two sequential gets against one KeyLoader lookup,
+then count the requests that many concurrent lookups by key turn into.
+
+  python3 benchmarks/bench_key_loader.py [request latency ms]
+"""
+import sys
+import threading
+import time
+
+import env
+env.setup()
+
+from mock_rdio_server import MockRdioServer
+from Rdio.rdio import AsyncRdio
+from Rdio.key_loader import KeyLoader
+
+def two_step(rdio, album_key):
+    album = rdio.call("get", {"keys": album_key})["result"][album_key]
+    tracks = rdio.call("get", {"keys": ", ".join(album["trackKeys"])})["result"]
+    return [tracks[k] for k in album["trackKeys"]]
+
+def timed(server, fn):
+    server.reset_counts()
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000, server.counts["requests"]
+
+def main(latency):
+    server = MockRdioServer(latency=latency).start()
+    AsyncRdio.api_root = server.url
+    rdio = AsyncRdio(("key", "secret"))
+    loader = KeyLoader(rdio, max_keys=50)
+
+    old, old_ms, old_requests = timed(server, lambda: two_step(rdio, "a7"))
+    new, new_ms, new_requests = timed(server, lambda: loader.load("a7", extras="tracks").result()["tracks"])
+    assert old == new
+    print("album tracks, two gets:  %6.1f ms, %d requests" % (old_ms, old_requests))
+    print("album tracks, KeyLoader: %6.1f ms, %d requests" % (new_ms, new_requests))
+
+    # 40 callers asking for 10 tracks each, overlapping, at about the same time.
+    wanted = [["t%d" % (i * 5 + j) for j in range(10)] for i in range(40)]
+    def concurrent():
+        futures = []
+        threads = [threading.Thread(target=lambda keys=keys: futures.append(loader.load_many(keys))) for keys in wanted]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        return [f.result() for f in futures]
+    results, ms, requests = timed(server, concurrent)
+    assert all(len(r) == 10 for r in results)
+    print("40 concurrent lookups:   %6.1f ms, %d requests" % (ms, requests))
+    server.stop()
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) / 1000 if len(sys.argv) > 1 else 0.05)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Ask for tracks while the Rdio app is launching, and count the scripts it takes.
+
+Rdio (benchmarks/fake_osascript.py) starts quit, takes --launch ms to launch and
+--switch ms to start playing what it's told to. A track is asked for, then another
+--interval ms later, the way someone impatient would. Reports how many scripts were run and how many of them were "play source",
+which track ended up playing, and when the second one first played.
+
+  python3 benchmarks/bench_launch.py [--launch 3000] [--switch 800] [--interval 500] [--seconds 10]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import env
+env.setup(stub_sublime=True)
+
+import sublime
+from fake_osascript import FakeRdio
+
+TRACKS = ["t2001", "t2002"]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--launch", type=float, default=3000, help="ms Rdio takes to launch")
+    parser.add_argument("--switch", type=float, default=800, help="ms Rdio takes to start playing a source")
+    parser.add_argument("--interval", type=float, default=500, help="ms between asking for the two tracks")
+    parser.add_argument("--latency", type=float, default=20, help="ms the fake osascript takes per script")
+    parser.add_argument("--seconds", type=float, default=10, help="how long to let the player work for")
+    options = parser.parse_args()
+
+    sublime.CACHE_PATH = tempfile.mkdtemp(prefix="sublime-rdio-launch-")
+    state_path = os.path.join(sublime.CACHE_PATH, "fake_osascript.json")
+    with open(state_path, "w") as f:
+        json.dump(dict(FakeRdio().state, running=False), f)
+    os.environ.update(FAKE_OSASCRIPT_STATE=state_path, FAKE_OSASCRIPT_LAUNCH=str(options.launch),
+                      FAKE_OSASCRIPT_SWITCH=str(options.switch), FAKE_OSASCRIPT_LATENCY=str(options.latency))
+    sublime.load_settings("Rdio.sublime-settings").update({
+        "osascript_command": [sys.executable, os.path.join(env.HERE, "fake_osascript.py")],
+        "status_duration": 0, # Keep the status updater's own scripts out of it.
+        "status_format": "{song}",
+        "status_update_period": 400,
+    })
+
+    real_platform, sys.platform = sys.platform, "darwin"
+    try:
+        from Rdio.applescript_rdio_player import AppleScriptRdioPlayer
+        from Rdio.status_updater import MusicPlayerStatusUpdater
+        player = AppleScriptRdioPlayer.Instance()
+    finally:
+        sys.platform = real_platform
+    player.status_updater = MusicPlayerStatusUpdater(player)
+
+    scripts = []
+    second_playing = []
+    execute_command = player._execute_command
+    def execute_and_record(cmd):
+        result = execute_command(cmd)
+        scripts.append(cmd)
+        with open(state_path) as f:
+            state = json.load(f)
+        if not second_playing and state["running"] and state["source"] == TRACKS[1]:
+            second_playing.append(time.perf_counter())
+        return result
+    player._execute_command = execute_and_record
+
+    start = time.perf_counter()
+    player.play_track(TRACKS[0])
+    sublime.run_timeouts(options.interval / 1000.0)
+    player.play_track(TRACKS[1])
+    sublime.run_timeouts(options.seconds - options.interval / 1000.0)
+    if player.coprocess is not None: player.coprocess.close()
+    with open(state_path) as f:
+        state = json.load(f)
+    shutil.rmtree(sublime.CACHE_PATH, ignore_errors=True)
+
+    print("scripts:          %d" % len(scripts))
+    print("play source:      %d" % state.get("sources_played", 0))
+    print("playing at end:   %s" % state["source"])
+    if second_playing:
+        print("%s playing after %.0f ms" % (TRACKS[1], (second_playing[0] - start) * 1000))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Compare om() with a reusable OAuthSigner, after checking they produce identical headers.
+
+  python3 benchmarks/bench_om.py [seconds per run]
+"""
+import sys
+import time
+
+import env
+env.setup()
+
+from Rdio.om import om, OAuthSigner
+
+CONSUMER = ("a1b2c3d4e5f6g7h8i9j0k1l2", "s3cr3t")
+TOKEN = ("tok3n", "t0ken-s3cret")
+URL = "http://api.rdio.com/1/"
+
+SAMPLES = [
+    {"method": "searchSuggestions", "query": "radiohead"},
+    {"method": "search", "query": "Beethoven: Symphonies 5, 7 & über", "types": "Artist, Album, Track"},
+    {"method": "get", "keys": "a171827, t2191829, t2191830"},
+    [("method", "getTracksForArtist"), ("artist", "r91318"), ("count", "50"), ("count", "20")],
+]
+
+def check_identical():
+    for token in (None, TOKEN):
+        signer = OAuthSigner(CONSUMER, token)
+        for url in (URL, "HTTPS://API.rdio.com:443/oauth/request_token?x=1&y=~ä"):
+            for params in SAMPLES:
+                for realm in (None, "http://api.rdio.com/"):
+                    expected = om(CONSUMER, url, params, token, realm=realm, timestamp="1400000000", nonce="424242")
+                    actual = signer.sign(url, params, realm=realm, timestamp="1400000000", nonce="424242")
+                    assert actual == expected, (expected, actual)
+
+def rate(sign, seconds):
+    n = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for params in SAMPLES:
+            sign(params)
+        n += len(SAMPLES)
+    return n / (time.perf_counter() - start)
+
+def main(seconds):
+    check_identical()
+    signer = OAuthSigner(CONSUMER, TOKEN)
+    one_shot = rate(lambda params: om(CONSUMER, URL, params, TOKEN), seconds)
+    reusable = rate(lambda params: signer.sign(URL, params), seconds)
+    print("om():        %9.0f signatures/s" % one_shot)
+    print("OAuthSigner: %9.0f signatures/s (%.2fx)" % (reusable, reusable / one_shot))
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 1.0)
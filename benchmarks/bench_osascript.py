@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Compare spawning osascript per script with the persistent coprocess.
+
+Runs the same queries a status update makes against benchmarks/fake_osascript.py.
+Set FAKE_OSASCRIPT_STARTUP / FAKE_OSASCRIPT_LATENCY to model a slower interpreter.
+
+  python3 benchmarks/bench_osascript.py [ticks]
+"""
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from osascript import OsascriptCoprocess, run_script
+
+FAKE = [sys.executable, os.path.join(HERE, "fake_osascript.py")]
+
+# The queries one MusicPlayerStatusUpdater tick used to make.
+TICK = [
+    'get running of application "Rdio"',
+    'tell application "Rdio" to artist of current track',
+    'tell application "Rdio" to player state',
+    'tell application "Rdio" to get {duration,artist,album,name} of current track & player position',
+]
+
+def bench(execute, ticks):
+    start = time.perf_counter()
+    for _ in range(ticks):
+        for cmd in TICK:
+            execute(cmd)
+    return (time.perf_counter() - start) / ticks
+
+def main(ticks):
+    spawn = bench(lambda cmd: run_script(cmd, FAKE), ticks)
+
+    coprocess = OsascriptCoprocess(FAKE)
+    coprocess.execute(TICK[0]) # Don't count start up.
+    persistent = bench(coprocess.execute, ticks)
+
+    # Make sure a crashed interpreter is replaced transparently.
+    coprocess._process.kill()
+    coprocess._process.wait()
+    assert coprocess.execute(TICK[0]) == "true"
+    coprocess.close()
+
+    print("ticks: %d (%d scripts each)" % (ticks, len(TICK)))
+    print("spawn per script: %8.2f ms/tick" % (spawn * 1000))
+    print("coprocess:        %8.2f ms/tick" % (persistent * 1000))
+    print("speedup:          %8.1fx" % (spawn / persistent))
+    print("coprocess restarts: %d" % coprocess.restarts)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 25)
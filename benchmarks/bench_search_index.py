@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Measure SearchIndex lookup latency while "typing" queries against a large index,
+and how long adding a page of results takes once the index is full.
+
+  python3 benchmarks/bench_search_index.py [entries]
+"""
+import random
+import sys
+import time
+
+import env
+env.setup()
+
+from Rdio.search_index import SearchIndex
+
+SYLLABLES = ["ra", "dio", "head", "daft", "punk", "the", "beat", "les", "mo", "zart", "sym", "pho", "ny",
+             "blue", "moon", "night", "love", "song", "kid", "ok", "com", "pu", "ter", "in", "rain", "bows"]
+
+def name(rng):
+    return " ".join("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3))).capitalize()
+                    for _ in range(rng.randint(1, 4)))
+
+def build(n, rng):
+    index = SearchIndex(max_entries=n)
+    types = ["r", "a", "t"]
+    start = time.perf_counter()
+    for i in range(n):
+        t = types[i % 3]
+        index.add({"type": t, "key": "%s%d" % (t, i), "name": name(rng), "artist": None if t == "r" else name(rng)})
+    return index, time.perf_counter() - start
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+def main(n):
+    rng = random.Random(42)
+    index, build_time = build(n, rng)
+    samples = []
+    for _ in range(200):
+        query = name(rng).lower()
+        for end in range(3, len(query) + 1): # every keystroke
+            start = time.perf_counter()
+            index.lookup(query[:end])
+            samples.append(time.perf_counter() - start)
+    print("entries: %d (built in %.2f s)" % (len(index), build_time))
+    print("lookups: %d" % len(samples))
+    for p in (0.5, 0.95, 0.99):
+        print("p%d:     %.3f ms" % (p * 100, percentile(samples, p) * 1000))
+
+    page = [{"type": "t", "key": "t%d" % (n + i), "name": name(rng), "artist": name(rng)} for i in range(20)]
+    start = time.perf_counter()
+    index.add_many(page) # Goes over max_entries, so evicts.
+    print("add_many of %d over the limit: %.3f ms" % (len(page), (time.perf_counter() - start) * 1000))
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
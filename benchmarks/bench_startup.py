@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Time loading the plugin the way Sublime does, in a fresh interpreter each run:
+importing sublime_rdio, calling plugin_loaded() and making every window command
+for a window. Also times how long until the status bar first shows the track.
+
+  python3 benchmarks/bench_startup.py [runs]
+
+The Rdio app is benchmarks/fake_osascript.py, and sys.platform pretends to be OS X.
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import env
+
+def child():
+    env.setup(stub_sublime=True)
+    import sublime, sublime_plugin
+    sublime.CACHE_PATH = tempfile.mkdtemp(prefix="sublime-rdio-startup-")
+    sublime.load_settings("Rdio.sublime-settings").update({
+        "osascript_command": [sys.executable, os.path.join(env.HERE, "fake_osascript.py")],
+        "status_duration": -1,
+        "status_format": "{song}",
+        "status_update_period": 400,
+        "rdio_api_key": "", # Nothing to validate, so no network.
+        "rdio_api_secret": "",
+    })
+
+    start = time.perf_counter()
+    import Rdio.sublime_rdio as sr
+    imported = time.perf_counter()
+    # The player refuses to start anywhere but OS X. (Importing with it set would
+    # make urllib look for OS X's proxy settings.)
+    sys.platform = "darwin"
+    sr.plugin_loaded()
+    loaded = time.perf_counter()
+    window = sublime.Window()
+    for value in list(vars(sr).values()):
+        if isinstance(value, type) and issubclass(value, sublime_plugin.WindowCommand) and value.__module__ == sr.__name__:
+            value(window)
+    commands = time.perf_counter()
+    sublime.run_until(lambda: sublime.status_messages, 10.0)
+    status = time.perf_counter()
+
+    player = sr.rdio_player()
+    if player.coprocess is not None: player.coprocess.close()
+    shutil.rmtree(sublime.CACHE_PATH, ignore_errors=True)
+    print(json.dumps({
+        "import_ms": (imported - start) * 1000,
+        "plugin_loaded_ms": (loaded - imported) * 1000,
+        "commands_ms": (commands - loaded) * 1000,
+        "startup_ms": (commands - start) * 1000,
+        "first_status_ms": (status - start) * 1000 if sublime.status_messages else None,
+    }))
+
+def measure(runs, osascript_latency=20):
+    """ Each number child() reports, as a list with one value per run. """
+    environment = dict(os.environ, FAKE_OSASCRIPT_LATENCY=str(osascript_latency))
+    results = {}
+    for _ in range(runs):
+        state = tempfile.mkdtemp(prefix="sublime-rdio-startup-")
+        environment["FAKE_OSASCRIPT_STATE"] = os.path.join(state, "fake_osascript.json")
+        try:
+            output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--child"], env=environment)
+        finally:
+            shutil.rmtree(state, ignore_errors=True)
+        for name, value in json.loads(output.decode("utf-8").splitlines()[-1]).items():
+            results.setdefault(name, []).append(value)
+    return results
+
+def main(runs):
+    for name, values in sorted(measure(runs).items()):
+        values = sorted(v for v in values if v is not None)
+        if values:
+            print("%-18s median %8.2f ms  min %8.2f ms" % (name, values[len(values) // 2], values[0]))
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--child"]:
+        child()
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Compare the old RdioSearchCommand.get_suggestions with build_suggestions on large
+searchSuggestions payloads.
+
+  python3 benchmarks/bench_suggestions.py [results per payload]
+"""
+import random
+import sys
+import time
+
+import env
+env.setup()
+
+from Rdio.suggestion_builder import build_suggestions
+
+def old_get_suggestions(rdio_results, max_text_length):
+    """ get_suggestions as it was, minus the per-type copies of the same branch. """
+    suggestions = []
+    for res in rdio_results['result']:
+        if res['type'] in ('r', 'a', 't'):
+            name = res.get("name", None)
+            t = (name, res.get("key", None))
+            if name and t not in suggestions:
+                suggestions.append(t)
+        else:
+            continue
+        s_list = list(zip(*suggestions))[0]
+        if len(", ".join(s_list)) > max_text_length:
+            suggestions.pop()
+            break
+    return suggestions
+
+def payload(n, rng):
+    results = []
+    for i in range(n):
+        type_ = rng.choice("raat")
+        key = "%s%d" % (type_, rng.randrange(n)) # some duplicates
+        results.append({"type": type_, "key": key, "name": rng.choice(["Radio", "Radiohead", "Head", "Kid A"]) + " %d" % i})
+    return results
+
+def rate(fn, seconds=0.5):
+    n = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        fn()
+        n += 1
+    return (time.perf_counter() - start) / n * 1000
+
+def main(n):
+    rng = random.Random(1)
+    results = payload(n, rng)
+    uses = dict((r["key"], rng.randrange(3)) for r in results).get
+    for width in (120, 100000): # a normal panel, and one wide enough for everything
+        old = rate(lambda: old_get_suggestions({'result': results}, width))
+        new = rate(lambda: build_suggestions(results, "radio", width, uses))
+        print("%d results, width %6d: old %8.3f ms, new %8.3f ms (%.1fx)" % (n, width, old, new, old / new))
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Press next, previous, play/pause and shuffle the way key repeat does, and count the scripts
+and status refreshes it takes (Rdio is benchmarks/fake_osascript.py).
+
+  python3 benchmarks/bench_transport.py [--repeat 30] [--latency 20]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import env
+env.setup(stub_sublime=True)
+
+import sublime
+
+# (name, method, presses)
+BURSTS = [
+    ("next x5", "next", 5),
+    ("previous x3", "previous", 3),
+    ("play/pause x2", "play_pause", 2),
+    ("shuffle x1", "toggle_shuffle", 1),
+]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=float, default=30, help="ms between presses")
+    parser.add_argument("--latency", type=float, default=20, help="ms the fake osascript takes per script")
+    options = parser.parse_args()
+
+    sublime.CACHE_PATH = tempfile.mkdtemp(prefix="sublime-rdio-transport-")
+    os.environ.update(FAKE_OSASCRIPT_STATE=os.path.join(sublime.CACHE_PATH, "fake_osascript.json"),
+                      FAKE_OSASCRIPT_LATENCY=str(options.latency))
+    sublime.load_settings("Rdio.sublime-settings").update({
+        "osascript_command": [sys.executable, os.path.join(env.HERE, "fake_osascript.py")],
+        "status_duration": 0, # Keep the status updater's own scripts out of it.
+        "status_format": "{song}",
+        "status_update_period": 400,
+    })
+
+    real_platform, sys.platform = sys.platform, "darwin"
+    try:
+        from Rdio.applescript_rdio_player import AppleScriptRdioPlayer
+        from Rdio.status_updater import MusicPlayerStatusUpdater
+        player = AppleScriptRdioPlayer.Instance()
+    finally:
+        sys.platform = real_platform
+    player.status_updater = MusicPlayerStatusUpdater(player)
+    player.is_running() # Start the interpreter before counting.
+
+    counts = {"scripts": 0, "refreshes": 0}
+    finished = [0]
+    execute_command = player._execute_command
+    def count_script(cmd):
+        counts["scripts"] += 1
+        try:
+            return execute_command(cmd)
+        finally:
+            finished[0] = time.perf_counter()
+    player._execute_command = count_script
+    show_status_message = player.show_status_message
+    def count_refresh():
+        counts["refreshes"] += 1
+        show_status_message()
+    player.show_status_message = count_refresh
+
+    print("%-14s %8s %8s %10s %13s %16s  %s" % ("burst", "presses", "scripts", "refreshes", "ms per press",
+        "done after (ms)", "playing"))
+    for name, method, presses in BURSTS:
+        counts.update(scripts=0, refreshes=0)
+        finished[0] = None
+        blocked = 0
+        for i in range(presses):
+            if i: sublime.run_timeouts(options.repeat / 1000.0)
+            start = time.perf_counter()
+            getattr(player, method)()
+            last_press = time.perf_counter()
+            blocked += last_press - start
+        sublime.run_timeouts(1.0)
+        done = "%.1f" % ((finished[0] - last_press) * 1000) if finished[0] else "-"
+        player.invalidate_snapshot()
+        print("%-14s %8d %8d %10d %13.1f %16s  %s" % (name, presses, counts["scripts"], counts["refreshes"],
+            blocked / presses * 1000, done, player.get_song()))
+
+    if player.coprocess is not None: player.coprocess.close()
+    shutil.rmtree(sublime.CACHE_PATH, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
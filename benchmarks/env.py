@@ -0,0 +1,23 @@
+"""
+Make the plugin importable outside of Sublime Text.
+
+Sublime loads this package as "Rdio", so register the repository under that name.
+With stub_sublime, the stand-ins for Sublime's own modules in stubs/ are importable too.
+"""
+import os
+import sys
+import types
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+STUBS = os.path.join(HERE, "stubs")
+
+def setup(stub_sublime=False):
+    if stub_sublime and STUBS not in sys.path:
+        sys.path.insert(0, STUBS)
+    if "Rdio" not in sys.modules:
+        package = types.ModuleType("Rdio")
+        package.__path__ = [ROOT]
+        sys.modules["Rdio"] = package
+    if HERE not in sys.path:
+        sys.path.insert(0, HERE)
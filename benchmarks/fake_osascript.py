@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+A stand-in for osascript that pretends to be the Rdio app, so the player code
+can be exercised and benchmarked on machines without OS X.
+
+It understands the two ways the plugin runs osascript:
+  fake_osascript.py -                       one script on stdin, result on stdout
+  fake_osascript.py -l JavaScript -e ...    the persistent framed protocol (see osascript.py)
+
+Environment variables:
+  FAKE_OSASCRIPT_STARTUP  milliseconds to sleep when the process starts (default 0)
+  FAKE_OSASCRIPT_LATENCY  milliseconds to sleep for every script (default 0)
+  FAKE_OSASCRIPT_LAUNCH   milliseconds Rdio takes to launch (default 0)
+  FAKE_OSASCRIPT_SWITCH   milliseconds Rdio takes to start playing a source (default 0)
+  FAKE_OSASCRIPT_STATE    JSON file used to persist player state between processes
+  FAKE_OSASCRIPT_LOG      file to append every script received to (one per line, escaped)
+"""
+import json
+import os
+import re
+import sys
+import time
+
+TRACKS = [
+    {"key": "t1001", "name": "Paranoid Android", "artist": "Radiohead", "album": "OK Computer", "duration": 383},
+    {"key": "t1002", "name": "Symphony No. 5 in C Minor, Op. 67: I. Allegro con brio", "artist": "Berliner Philharmoniker, Herbert von Karajan", "album": "Beethoven: Symphonies 5, 7", "duration": 447},
+    {"key": "t1003", "name": "Get Lucky", "artist": "Daft Punk", "album": "Random Access Memories", "duration": 369},
+]
+
+class ScriptError(Exception):
+    """ The script failed, as AppleScript does when it reads the current track and there isn't one. """
+    pass
+
+class FakeRdio():
+    def __init__(self, state=None):
+        self.state = state or {"running": True, "player_state": "playing", "index": 0,
+                               "started": time.time(), "paused_at": None, "shuffle": False,
+                               "source": None}
+
+    # Helpers
+    def track(self):
+        if self.state["index"] is None:
+            raise ScriptError("Can't get current track.")
+        return TRACKS[self.state["index"] % len(TRACKS)]
+
+    def position(self):
+        st = self.state
+        elapsed = (st["paused_at"] or time.time()) - st["started"]
+        return min(elapsed, self.track()["duration"])
+
+    def set_playing(self, playing):
+        st = self.state
+        if playing and st["player_state"] != "playing":
+            st["started"] = time.time() - self.position()
+            st["paused_at"] = None
+            st["player_state"] = "playing"
+        elif not playing and st["player_state"] == "playing":
+            st["paused_at"] = time.time()
+            st["player_state"] = "paused"
+
+    def skip(self, n):
+        self.state["index"] = ((self.state["index"] or 0) + n) % len(TRACKS)
+        self.state["started"] = time.time()
+        if self.state["player_state"] != "playing":
+            self.state["paused_at"] = self.state["started"]
+
+    def finish_switching(self):
+        st = self.state
+        switching = st.get("switching")
+        if switching and time.time() >= switching["at"]:
+            st["switching"] = None
+            st["source"] = switching["source"]
+            self.skip(1)
+            self.set_playing(True)
+
+    def percent(self):
+        return 100.0 * self.position() / self.track()["duration"]
+
+    def property(self, name):
+        if name == "player state": return self.state["player_state"]
+        if name == "shuffle": return "true" if self.state["shuffle"] else "false"
+        t = self.track()
+        if name == "key" and (self.state["source"] or "").startswith("t"):
+            return self.state["source"] # The track asked for is playing.
+        if name == "duration": return "%s.0" % t["duration"]
+        if name == "player position": return repr(self.percent())
+        return t[name]
+
+    def evaluate(self, expression):
+        m = re.match(r'(.*) is ("[^"]*"|\w+)$', expression)
+        if m:
+            return "true" if self.evaluate(m.group(1)) == m.group(2).strip('"') else "false"
+        m = re.match(r'(duration|artist|album|name|key) of current track$', expression)
+        if m:
+            return self.property(m.group(1))
+        return self.property(expression)
+
+    # Scripts
+    def run_transaction(self, script):
+        """ Run a script built by applescript_rdio_player.Transaction. """
+        lines = [line.strip() for line in script.split("\n")]
+        if not self.state["running"]:
+            if 'tell application "Rdio" to launch' in lines:
+                self.run('tell application "Rdio" to launch')
+            return "false"
+        lines = lines[lines.index('tell application "Rdio"') + 1:lines.index("end tell")]
+        fields = ["true"]
+        variables = {}
+        in_try = False
+        i = 0
+        while i < len(lines):
+            line = lines[i]
+            i += 1
+            try:
+                if line == "try":
+                    in_try = True
+                elif line == "on error":
+                    # Nothing failed, so skip the handler.
+                    i = lines.index("end try", i) + 1
+                    in_try = False
+                elif line == "end try":
+                    in_try = False
+                elif line == 'set end of fields to ""':
+                    fields.append("")
+                elif line.startswith("set end of fields to ("):
+                    expression = line[len("set end of fields to ("):-len(" as string)")]
+                    if expression.startswith("(") and expression.endswith(")"): expression = expression[1:-1]
+                    fields.append(self.evaluate(expression))
+                elif re.match(r"set \w+ to ", line):
+                    name, expression = re.match(r"set (\w+) to \(?(.*?)\)?$", line).groups()
+                    variables[name] = expression == "true" or (expression != "false" and self.evaluate(expression) == "true")
+                elif line.startswith("if not "):
+                    condition = line[len("if not "):-len(" then")]
+                    met = variables[condition] if condition in variables else self.evaluate(condition.strip("()")) == "true"
+                    if met: i = lines.index("end if", i) + 1
+                elif line != "end if":
+                    self.run('tell application "Rdio" to ' + line)
+            except ScriptError:
+                if not in_try: raise
+                # Carry on in the "on error" handler, or after the try block if there isn't one.
+                end_try = lines.index("end try", i)
+                handler = lines.index("on error", i) if "on error" in lines[i:end_try] else end_try
+                i = handler + 1
+                in_try = handler != end_try
+        return "\x1f".join(fields)
+
+    def run(self, script):
+        st = self.state
+        if not st["running"] and st.get("launched") is not None:
+            st["running"] = time.time() - st["launched"] >= launch_seconds()
+        if st["running"]:
+            self.finish_switching()
+        if 'text item delimiters to character id 31' in script:
+            return self.run_transaction(script)
+        if 'running of application "Rdio"' in script:
+            return "true" if st["running"] else "false"
+        if not st["running"]:
+            if 'to launch' in script and st.get("launched") is None:
+                st["launched"] = time.time()
+                st["running"] = launch_seconds() <= 0
+                st["index"] = None # No current track until something is played.
+            return ""
+
+        m = re.search(r'play source "([^"]*)"', script)
+        if m:
+            # Until it's switched, the old track carries on; asking again starts over.
+            st["sources_played"] = st.get("sources_played", 0) + 1
+            st["switching"] = {"source": m.group(1), "at": time.time() + switch_seconds()}
+            self.finish_switching()
+            return ""
+        if 'get {duration,artist,album,name} of current track & player position' in script:
+            return ", ".join([self.property("duration"), self.property("artist"), self.property("album"),
+                              self.property("name"), self.property("player position")])
+        m = re.search(r'to (duration|artist|album|name|key) of current track', script)
+        if m:
+            return self.property(m.group(1))
+        if 'set shuffle to true' in script:
+            st["shuffle"] = True
+            return ""
+        if 'set shuffle to not shuffle' in script:
+            st["shuffle"] = not st["shuffle"]
+            return ""
+        if 'set shuffle to false' in script:
+            st["shuffle"] = False
+            return ""
+        for prop in ("player position", "player state", "shuffle"):
+            if script.endswith("to " + prop):
+                return self.property(prop)
+        if script.endswith("to next track"):
+            self.skip(1)
+            return ""
+        if script.endswith("to previous track"):
+            self.skip(-1)
+            return ""
+        if script.endswith("to playpause"):
+            self.set_playing(st["player_state"] != "playing")
+            return ""
+        if script.endswith("to pause"):
+            self.set_playing(False)
+            return ""
+        if script.endswith("to play"):
+            self.set_playing(True)
+            return ""
+        return ""
+
+def launch_seconds():
+    return float(os.environ.get("FAKE_OSASCRIPT_LAUNCH", "0") or 0) / 1000.0
+
+def switch_seconds():
+    return float(os.environ.get("FAKE_OSASCRIPT_SWITCH", "0") or 0) / 1000.0
+
+def sleep_ms(var):
+    ms = float(os.environ.get(var, "0") or 0)
+    if ms > 0: time.sleep(ms / 1000.0)
+
+def log(script):
+    path = os.environ.get("FAKE_OSASCRIPT_LOG")
+    if path:
+        with open(path, "a") as f:
+            f.write(script.encode("unicode_escape").decode("ascii") + "\n")
+
+def load_player():
+    path = os.environ.get("FAKE_OSASCRIPT_STATE")
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return FakeRdio(json.load(f))
+    return FakeRdio()
+
+def save_player(player):
+    path = os.environ.get("FAKE_OSASCRIPT_STATE")
+    if path:
+        with open(path, "w") as f:
+            json.dump(player.state, f)
+
+def run_once(player):
+    script = sys.stdin.buffer.read().decode("utf-8").strip()
+    log(script)
+    sleep_ms("FAKE_OSASCRIPT_LATENCY")
+    try:
+        result = player.run(script)
+    except ScriptError as e:
+        save_player(player)
+        sys.stderr.write("execution error: %s\n" % e)
+        sys.exit(1)
+    save_player(player)
+    sys.stdout.write(result + "\n")
+
+def serve(player):
+    stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+    while True:
+        header = stdin.readline()
+        if not header: break
+        script = stdin.read(int(header)).decode("utf-8").strip()
+        log(script)
+        sleep_ms("FAKE_OSASCRIPT_LATENCY")
+        try:
+            status, body = b"ok", player.run(script).encode("utf-8")
+        except ScriptError as e:
+            status, body = b"error", str(e).encode("utf-8")
+        save_player(player)
+        stdout.write(status + b" " + str(len(body)).encode("ascii") + b"\n" + body)
+        stdout.flush()
+
+def main(args):
+    sleep_ms("FAKE_OSASCRIPT_STARTUP")
+    player = load_player()
+    if "-l" in args:
+        serve(player)
+    else:
+        run_once(player)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
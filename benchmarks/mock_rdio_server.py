@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+A local stand-in for http://api.rdio.com/ that serves canned responses.
+
+  python3 benchmarks/mock_rdio_server.py [port]
+
+Or from Python:
+
+  server = MockRdioServer(latency=0.02, connect_latency=0.05).start()
+  Rdio.api_root = server.url
+  ...
+  server.stop()
+
+`latency` is added to every request and `connect_latency` to the first request on
+each new connection, to model the round trips a TCP/TLS handshake costs.
+
+With `consumer` (a (key, secret) pair), requests must carry a valid OAuth signature
+for it, made with no token or one of `tokens` ({token: secret}), or get a 401.
+"""
+import gzip
+import json
+import re
+import sys
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qsl, unquote
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qsl
+    from urllib import unquote
+
+import env
+env.setup()
+
+from Rdio.om import om
+
+ARTISTS = [{"type": "r", "key": "r%d" % i, "name": "Artist %d" % i} for i in range(200)]
+ALBUMS = [{"type": "a", "key": "a%d" % i, "name": "Album %d, Vol. %d" % (i, i % 3), "artist": "Artist %d" % (i % 200),
+           "length": 10, "trackKeys": ["t%d" % (i * 10 + j) for j in range(10)]} for i in range(500)]
+TRACKS = [{"type": "t", "key": "t%d" % i, "name": "Track %d" % i, "artist": "Artist %d" % (i // 10 % 200),
+           "album": "Album %d, Vol. %d" % (i // 10, i // 10 % 3), "albumKey": "a%d" % (i // 10), "duration": 200 + i % 100}
+          for i in range(5000)]
+OBJECTS = dict((o["key"], o) for o in ARTISTS + ALBUMS + TRACKS)
+
+def _matching(query, objects):
+    query = query.lower()
+    return [o for o in objects if query in o["name"].lower()]
+
+def handle_method(params):
+    """ Return the JSON-able response for an API call. """
+    method = params.get("method")
+    start = int(params.get("start", 0))
+    count = int(params.get("count", 10))
+    if method == "searchSuggestions":
+        query = params.get("query", "")
+        results = (_matching(query, ARTISTS)[:4] + _matching(query, ALBUMS)[:3] + _matching(query, TRACKS)[:3])
+        return {"status": "ok", "result": results}
+    if method == "search":
+        query = params.get("query", "")
+        results = _matching(query, ARTISTS) + _matching(query, ALBUMS) + _matching(query, TRACKS)
+        return {"status": "ok", "result": {"number_results": len(results), "results": results[start:start + count]}}
+    if method == "get":
+        keys = [k.strip() for k in params.get("keys", "").split(",") if k.strip()]
+        result = {}
+        for k in keys:
+            if k in OBJECTS:
+                o = dict(OBJECTS[k])
+                if "tracks" in params.get("extras", "") and o["type"] == "a":
+                    o["tracks"] = [OBJECTS[t] for t in o["trackKeys"]]
+                result[k] = o
+        return {"status": "ok", "result": result}
+    if method == "getTracksForArtist":
+        name = OBJECTS.get(params.get("artist"), {}).get("name")
+        return {"status": "ok", "result": [t for t in TRACKS if t["artist"] == name][start:start + count]}
+    if method == "getAlbumsForArtist":
+        name = OBJECTS.get(params.get("artist"), {}).get("name")
+        return {"status": "ok", "result": [a for a in ALBUMS if a["artist"] == name][start:start + count]}
+    return {"status": "error", "message": "Unknown method: %s" % method}
+
+def check_signature(server, url, authorization, body_params):
+    """ Whether authorization is a valid OAuth header for POSTing body_params to url. """
+    if not authorization.startswith("OAuth "): return False
+    oauth = dict((k, unquote(v)) for k, v in re.findall(r'(\w+)="([^"]*)"', authorization))
+    if oauth.get("oauth_consumer_key") != server.consumer[0]: return False
+    token = None
+    if "oauth_token" in oauth:
+        if oauth["oauth_token"] not in server.tokens: return False
+        token = (oauth["oauth_token"], server.tokens[oauth["oauth_token"]])
+    expected = om(server.consumer, url, body_params, token,
+                  timestamp=oauth.get("oauth_timestamp"), nonce=oauth.get("oauth_nonce"))
+    expected = dict((k, unquote(v)) for k, v in re.findall(r'(\w+)="([^"]*)"', expected))
+    return expected["oauth_signature"] == oauth.get("oauth_signature")
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.new_connection = True
+        self.server.counts["connections"] += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+        params = dict(parse_qsl(body, keep_blank_values=True))
+        if server.consumer is not None:
+            url = "http://%s%s" % (self.headers.get("Host"), self.path)
+            if not check_signature(server, url, self.headers.get("Authorization", ""), parse_qsl(body, keep_blank_values=True)):
+                with server.lock:
+                    server.counts["auth_failures"] += 1
+                self.send_error(401, "Invalid OAuth signature")
+                return
+        with server.lock:
+            server.counts["requests"] += 1
+            method_counts = server.counts["methods"]
+            method_counts[params.get("method")] = method_counts.get(params.get("method"), 0) + 1
+
+        delay = server.latency + (server.connect_latency if self.new_connection else 0)
+        self.new_connection = False
+        if delay: time.sleep(delay)
+
+        data = json.dumps(handle_method(params)).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            data = gzip.compress(data)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+class MockRdioServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, connect_latency=0.0, consumer=None, tokens=None):
+        HTTPServer.__init__(self, ("127.0.0.1", port), Handler)
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.consumer = consumer
+        self.tokens = tokens or {}
+        self.lock = threading.Lock()
+        self.reset_counts()
+
+    def reset_counts(self):
+        self.counts = {"connections": 0, "requests": 0, "auth_failures": 0, "methods": {}}
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d" % self.server_address[1]
+
+    def start(self):
+        t = threading.Thread(target=self.serve_forever)
+        t.daemon = True
+        t.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+if __name__ == "__main__":
+    server = MockRdioServer(int(sys.argv[1]) if len(sys.argv) > 1 else 8080)
+    print("Serving a mock Rdio API at %s/1/" % server.url)
+    server.serve_forever()
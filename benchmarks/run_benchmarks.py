@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Run the plugin headlessly against benchmarks/fake_osascript.py and a mock Rdio API
+(stubs/ stands in for Sublime) and write the results as a JSON report.
+
+  python3 benchmarks/run_benchmarks.py [--output report.json] [--compare old.json] [--quick]
+
+Scenarios:
+  startup         loading the plugin in a fresh interpreter, and until the status first shows
+  status_tick     the status bar updater running for a few seconds while music plays
+  typing_storm    typing queries into the search panel, keystroke to Rdio's suggestions
+  album_browse    "Show tracks on" an album, with and without the tracks prefetched
+  om_signing      OAuth signatures per second, om() and OAuthSigner
+
+Reports from the same options are comparable: --compare prints how each number changed.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import env
+env.setup(stub_sublime=True)
+
+import sublime
+from mock_rdio_server import MockRdioServer
+
+FAKE_OSASCRIPT = [sys.executable, os.path.join(env.HERE, "fake_osascript.py")]
+CONSUMER = ("bench-key", "bench-secret")
+
+def percentiles(samples, scale=1000.0):
+    """ mean, p50, p95, p99 and max of samples (in seconds), in ms. """
+    samples = sorted(samples)
+    if not samples: return {}
+    pick = lambda p: samples[min(len(samples) - 1, int(len(samples) * p))] * scale
+    return {"n": len(samples), "mean_ms": sum(samples) / len(samples) * scale,
+            "p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99), "max_ms": samples[-1] * scale}
+
+def configure(options, server):
+    sublime.CACHE_PATH = tempfile.mkdtemp(prefix="sublime-rdio-bench-")
+    sublime.load_settings("Rdio.sublime-settings").update({
+        "osascript_command": FAKE_OSASCRIPT,
+        "status_duration": -1,
+        "status_format": "{icon} - {song} - {artist} - {album} - {time}/{duration}",
+        "status_update_period": 400,
+        "rdio_api_key": CONSUMER[0],
+        "rdio_api_secret": CONSUMER[1],
+        "enable_search_suggestions": True,
+        "enable_response_cache": False, # Every run should talk to the server.
+        "enable_perf_stats": True,
+    })
+    os.environ["FAKE_OSASCRIPT_LATENCY"] = str(options.osascript_latency)
+    os.environ["FAKE_OSASCRIPT_STATE"] = os.path.join(sublime.CACHE_PATH, "fake_osascript.json")
+
+    from Rdio.rdio import Rdio
+    Rdio.api_root = server.url
+
+def make_player():
+    # The player refuses to start anywhere but OS X.
+    real_platform, sys.platform = sys.platform, "darwin"
+    try:
+        from Rdio.applescript_rdio_player import AppleScriptRdioPlayer
+        return AppleScriptRdioPlayer.Instance()
+    finally:
+        sys.platform = real_platform
+
+def bench_startup(options):
+    import bench_startup
+    runs = bench_startup.measure(options.startup_runs, options.osascript_latency)
+    medians = {}
+    for name, values in runs.items():
+        values = sorted(v for v in values if v is not None)
+        medians[name] = values[len(values) // 2] if values else None
+    return dict(medians, runs=options.startup_runs)
+
+def bench_status_tick(options):
+    from Rdio import perf
+    from Rdio.status_updater import MusicPlayerStatusUpdater
+    player = make_player()
+    player.is_running() # Start the interpreter before timing.
+    perf.reset()
+    scripts = player.coprocess.scripts_run if player.coprocess else 0
+
+    updater = MusicPlayerStatusUpdater(player)
+    start = time.perf_counter()
+    sublime.run_timeouts(options.status_seconds)
+    elapsed = time.perf_counter() - start
+    updater._generation += 1 # Cancel the next tick.
+    updater._stop()
+
+    tick = perf.stats().get("MusicPlayerStatusUpdater._run", {})
+    scripts = (player.coprocess.scripts_run if player.coprocess else 0) - scripts
+    return {
+        "seconds": elapsed,
+        "ticks": tick.get("count", 0),
+        "tick_mean_ms": tick.get("mean_ms", 0.0),
+        "tick_p95_ms": tick.get("p95_ms", 0.0),
+        "busy_ms_per_second": tick.get("count", 0) * tick.get("mean_ms", 0.0) / elapsed,
+        "scripts_per_second": scripts / elapsed,
+    }
+
+def open_search(sr, window):
+    cmd = sr.RdioSearchCommand(window)
+    cmd.run()
+    delivered = []
+    show_new_suggestions = cmd.show_new_suggestions
+    def record_delivery():
+        before = cmd.suggestions
+        show_new_suggestions()
+        if cmd.suggestions is not before:
+            delivered.append((time.perf_counter(), cmd.last_sent_query))
+    cmd.show_new_suggestions = record_delivery
+    return cmd, delivered
+
+def bench_typing_storm(options, server, rng):
+    import Rdio.sublime_rdio as sr
+    window = sublime.Window()
+    keystroke_samples = []
+    latency_samples = []
+    server.reset_counts()
+    panels_opened = window.input_panels_opened
+    api_calls = 0
+    queries = ["%s %d" % (rng.choice(["artist", "album", "track"]), rng.randrange(1, 200)) for _ in range(options.queries)]
+    for query in queries:
+        sr.SUGGESTION_CACHE.clear()
+        cmd, delivered = open_search(sr, window)
+        for c in query:
+            calls = sublime.api_calls
+            start = time.perf_counter()
+            window.type(c)
+            keystroke_samples.append(time.perf_counter() - start)
+            api_calls += sublime.api_calls - calls
+            last_keystroke = time.perf_counter()
+            sublime.run_timeouts(options.keystroke_interval / 1000.0)
+        if sublime.run_until(lambda: delivered and delivered[-1][1] == query, 5.0):
+            latency_samples.append(delivered[-1][0] - last_keystroke)
+        window.input_panel[4]() # on_cancel
+        sublime.run_timeouts(0)
+    result = {
+        "queries": len(queries),
+        "keystrokes": len(keystroke_samples),
+        "input_panels_opened": window.input_panels_opened - panels_opened,
+        "api_calls_per_keystroke": api_calls / float(len(keystroke_samples)),
+        "suggestion_requests_per_query": server.counts["methods"].get("searchSuggestions", 0) / float(len(queries)),
+        "keystroke": percentiles(keystroke_samples),
+        "last_keystroke_to_suggestions": percentiles(latency_samples),
+    }
+    return result
+
+def bench_album_browse(options, server, rng):
+    import Rdio.sublime_rdio as sr
+    window = sublime.Window()
+    cmd, _ = open_search(sr, window)
+    window.input_panel[4]()
+    result = {}
+    for prefetch in (False, True):
+        samples = []
+        server.reset_counts()
+        for _ in range(options.albums):
+            key = "a%d" % rng.randrange(500)
+            if prefetch:
+                cmd.prefetch([key])
+                sublime.run_until(lambda: sr.prefetcher().get(*sr.album_tracks_call(key)) is not None, 5.0)
+            shown = len(window.quick_panels)
+            start = time.perf_counter()
+            cmd.handle_album_selection(1, key, key)
+            if sublime.run_until(lambda: len(window.quick_panels) > shown, 5.0):
+                samples.append(time.perf_counter() - start)
+        result["prefetched" if prefetch else "cold"] = dict(percentiles(samples),
+            requests_per_album=server.counts["requests"] / float(options.albums))
+    return result
+
+def bench_om_signing(options):
+    import bench_om
+    bench_om.check_identical()
+    from Rdio.om import om, OAuthSigner
+    signer = OAuthSigner(bench_om.CONSUMER, bench_om.TOKEN)
+    return {
+        "om_per_second": bench_om.rate(lambda params: om(bench_om.CONSUMER, bench_om.URL, params, bench_om.TOKEN), options.om_seconds),
+        "signer_per_second": bench_om.rate(lambda params: signer.sign(bench_om.URL, params), options.om_seconds),
+    }
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=env.ROOT,
+                                       stderr=subprocess.DEVNULL).decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def flatten(report, prefix=""):
+    """ {"a": {"b": 1}} -> {"a.b": 1}, keeping only numbers. """
+    flat = {}
+    for key, value in report.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, prefix + key + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+def compare(old, new):
+    old, new = flatten(old["results"]), flatten(new["results"])
+    for key in sorted(new):
+        if key in old:
+            change = "" if not old[key] else "%+.1f%%" % ((new[key] - old[key]) / old[key] * 100)
+            print("%-60s %12.3f -> %12.3f %9s" % (key, old[key], new[key], change))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default="benchmark-report.json", help="where to write the JSON report")
+    parser.add_argument("--compare", help="a previous report to compare with")
+    parser.add_argument("--quick", action="store_true", help="fewer iterations, for a smoke test")
+    parser.add_argument("--osascript-latency", type=float, default=20, help="ms the fake osascript takes per script")
+    parser.add_argument("--api-latency", type=float, default=50, help="ms the mock API takes per request")
+    parser.add_argument("--keystroke-interval", type=float, default=60, help="ms between simulated keystrokes")
+    parser.add_argument("--seed", type=int, default=1)
+    options = parser.parse_args()
+    options.status_seconds = 2.0 if options.quick else 10.0
+    options.queries = 3 if options.quick else 20
+    options.albums = 5 if options.quick else 30
+    options.om_seconds = 0.2 if options.quick else 1.0
+    options.startup_runs = 3 if options.quick else 10
+
+    server = MockRdioServer(latency=options.api_latency / 1000.0, consumer=CONSUMER).start()
+    configure(options, server)
+    rng = random.Random(options.seed)
+
+    import Rdio.sublime_rdio as sr
+    sr.plugin_loaded()
+    sublime.run_until(lambda: not sr.CREDENTIALS.needs_validation(), 5.0)
+    if not sr.VALID_API_CREDENTIALS:
+        sys.exit("The mock API didn't accept the credentials.")
+
+    results = {}
+    try:
+        results["startup"] = bench_startup(options)
+        results["status_tick"] = bench_status_tick(options)
+        results["typing_storm"] = bench_typing_storm(options, server, rng)
+        results["album_browse"] = bench_album_browse(options, server, rng)
+        results["om_signing"] = bench_om_signing(options)
+        results["auth_failures"] = server.counts["auth_failures"]
+    finally:
+        server.stop()
+        player = make_player()
+        if player.coprocess is not None: player.coprocess.close()
+        shutil.rmtree(sublime.CACHE_PATH, ignore_errors=True)
+
+    report = {
+        "meta": {"time": time.time(), "revision": git_revision(), "python": platform.python_version(),
+                 "platform": platform.platform()},
+        "options": dict((k, v) for k, v in vars(options).items() if k not in ("output", "compare")),
+        "results": results,
+    }
+    with open(options.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(json.dumps(results, indent=2, sort_keys=True))
+    print("Wrote %s" % options.output)
+
+    if options.compare:
+        with open(options.compare) as f:
+            compare(json.load(f), report)
+
+if __name__ == "__main__":
+    main()
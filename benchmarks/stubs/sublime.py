@@ -0,0 +1,295 @@
+"""
+Just enough of Sublime Text's sublime module to run the plugin headlessly.
+
+Callbacks passed to set_timeout and set_timeout_async are queued, and run by
+run_timeouts() (standing in for Sublime's main thread) once they're due. Status and
+error messages are appended to status_messages and error_messages.
+
+In Sublime Text 3 every call on a View, Window or Selection is a round trip to the
+editor process, so api_calls counts them.
+"""
+import heapq
+import itertools
+import os
+import re
+import tempfile
+import threading
+import time
+
+CACHE_PATH = os.path.join(tempfile.gettempdir(), "sublime-rdio-bench")
+
+status_messages = []
+error_messages = []
+api_calls = 0
+
+def version():
+    return "3126"
+
+def platform():
+    return "osx"
+
+def cache_path():
+    return CACHE_PATH
+
+def packages_path():
+    return os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def status_message(message):
+    status_messages.append(message)
+
+def error_message(message):
+    error_messages.append(message)
+
+# Settings
+
+class Settings():
+    def __init__(self):
+        self._values = {}
+
+    def get(self, name, default=None):
+        return self._values.get(name, default)
+
+    def set(self, name, value):
+        self._values[name] = value
+
+    def has(self, name):
+        return name in self._values
+
+    def erase(self, name):
+        self._values.pop(name, None)
+
+    def update(self, values):
+        """ Not in Sublime's API: set several settings at once. """
+        self._values.update(values)
+
+    def add_on_change(self, key, callback):
+        pass
+
+    def clear_on_change(self, key):
+        pass
+
+_settings = {}
+
+def load_settings(name):
+    if name not in _settings:
+        _settings[name] = Settings()
+    return _settings[name]
+
+def save_settings(name):
+    pass
+
+# Timeouts
+
+_timeouts = [] # heap of (due, sequence, callback)
+_sequence = itertools.count()
+_timeouts_changed = threading.Condition()
+
+def set_timeout(callback, delay=0):
+    with _timeouts_changed:
+        heapq.heappush(_timeouts, (time.monotonic() + delay / 1000.0, next(_sequence), callback))
+        _timeouts_changed.notify_all()
+
+set_timeout_async = set_timeout
+
+def run_timeouts(seconds=0):
+    """ Run callbacks as they fall due for the next seconds (at least those due now). """
+    run_until(lambda: False, seconds)
+
+def run_until(predicate, timeout):
+    """ Run callbacks as they fall due until predicate() is true or timeout seconds pass. Returns predicate(). """
+    deadline = time.monotonic() + timeout
+    while True:
+        with _timeouts_changed:
+            now = time.monotonic()
+            if _timeouts and _timeouts[0][0] <= now:
+                callback = heapq.heappop(_timeouts)[2]
+            else:
+                callback = None
+                if now >= deadline or predicate(): return predicate()
+                due = min(_timeouts[0][0], deadline) if _timeouts else deadline
+                # Wake up now and then to re-check predicate, which other threads may make true.
+                _timeouts_changed.wait(min(due - now, 0.001))
+        if callback is not None:
+            callback()
+            if predicate(): return True
+
+def clear_timeouts():
+    with _timeouts_changed:
+        del _timeouts[:]
+
+# Views and windows
+
+class Region():
+    def __init__(self, a, b=None):
+        self.a = a
+        self.b = a if b is None else b
+
+    def begin(self):
+        return min(self.a, self.b)
+
+    def end(self):
+        return max(self.a, self.b)
+
+    def size(self):
+        return self.end() - self.begin()
+
+class Selection(list):
+    def clear(self):
+        del self[:]
+
+    def add(self, region):
+        self.append(region)
+
+class Edit():
+    pass
+
+def _command_name(cls):
+    """ "RdioReplaceRegionCommand" -> "rdio_replace_region", as Sublime names commands. """
+    return re.sub(r"(?<!^)(?=[A-Z])", "_", cls.__name__[:-len("Command")]).lower()
+
+def _subclasses(cls):
+    for subclass in cls.__subclasses__():
+        yield subclass
+        for subsubclass in _subclasses(subclass):
+            yield subsubclass
+
+_text_commands = {} # name -> TextCommand subclass
+
+class View():
+    def __init__(self, text="", width=100):
+        self.text = text
+        self.name = ""
+        self.width = width # in characters
+        self._sel = Selection()
+        self._on_modified = None # called with the new text when it changes
+
+    def is_valid(self):
+        return True
+
+    def size(self):
+        return len(self.text)
+
+    def substr(self, region):
+        return self.text[region.begin():region.end()]
+
+    def find(self, pattern, start):
+        i = self.text.find(pattern, start)
+        return Region(i, i + len(pattern)) if i != -1 else Region(-1, -1)
+
+    def text_point(self, row, col):
+        return col
+
+    def sel(self):
+        return self._sel
+
+    def show(self, point):
+        pass
+
+    EM_WIDTH = 8.0
+    LINE_HEIGHT = 16.0
+
+    def em_width(self):
+        return self.EM_WIDTH
+
+    def line_height(self):
+        return self.LINE_HEIGHT
+
+    def viewport_extent(self):
+        return (self.width * self.EM_WIDTH, self.LINE_HEIGHT)
+
+    def set_name(self, name):
+        self.name = name
+
+    def set_scratch(self, scratch):
+        pass
+
+    def set_read_only(self, read_only):
+        pass
+
+    def settings(self):
+        return Settings()
+
+    def replace(self, edit, region, text):
+        self._replace(region.begin(), region.end(), text)
+
+    def insert(self, edit, point, text):
+        self._replace(point, point, text)
+        return len(text)
+
+    def erase(self, edit, region):
+        self._replace(region.begin(), region.end(), "")
+
+    def _replace(self, begin, end, text):
+        self.text = self.text[:begin] + text + self.text[end:]
+        if self._on_modified is not None: self._on_modified(self.text)
+
+    def run_command(self, command, args=None):
+        """ Run one of the plugin's TextCommands, or the built in "append". """
+        args = args or {}
+        if command == "append":
+            self._replace(len(self.text), len(self.text), args["characters"])
+            return
+        cls = _text_commands.get(command)
+        if cls is None:
+            import sublime_plugin
+            _text_commands.update((_command_name(c), c) for c in _subclasses(sublime_plugin.TextCommand))
+            cls = _text_commands[command]
+        cls(self).run(Edit(), **args)
+
+class Window():
+    """ Records the panels shown instead of showing them. """
+    def __init__(self):
+        self.input_panel = None # (caption, view, on_done, on_change, on_cancel)
+        self.input_panels_opened = 0
+        self.quick_panels = [] # (items, on_select)
+        self.views = []
+
+    def show_input_panel(self, caption, initial_text, on_done, on_change, on_cancel):
+        view = View(initial_text)
+        view._on_modified = on_change
+        self.input_panel = (caption, view, on_done, on_change, on_cancel)
+        self.input_panels_opened += 1
+        if on_change is not None: on_change(initial_text)
+        return view
+
+    def show_quick_panel(self, items, on_select, flags=0, selected_index=-1, on_highlight=None):
+        self.quick_panels.append((items, on_select))
+
+    def new_file(self):
+        view = View()
+        self.views.append(view)
+        return view
+
+    def active_view(self):
+        return self.views[-1] if self.views else None
+
+    # Not in Sublime's API: act like the user.
+
+    def type(self, characters):
+        """ Type characters, one at a time, at the cursor of the input panel. """
+        for c in characters:
+            # Without going through the API, so only the plugin's calls are counted.
+            view = self.input_panel[1]
+            cursor = min(view._sel[0].a, view._sel[0].b) if view._sel else len(view.text)
+            view._sel[:] = [Region(cursor + 1)]
+            view._replace(cursor, cursor, c)
+
+def _count_api_calls(cls, exclude=()):
+    def counted(fn):
+        def wrapper(*args, **kwargs):
+            global api_calls
+            api_calls += 1
+            return fn(*args, **kwargs)
+        return wrapper
+    for name, value in list(vars(cls).items()):
+        if callable(value) and not name.startswith("_") and name not in exclude:
+            setattr(cls, name, counted(value))
+
+_count_api_calls(Selection)
+_count_api_calls(View)
+_count_api_calls(Window, exclude=("type",))
+
+_window = Window()
+
+def active_window():
+    return _window
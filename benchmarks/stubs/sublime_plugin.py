@@ -0,0 +1,15 @@
+""" Just enough of Sublime Text's sublime_plugin module to run the plugin headlessly. """
+
+class ApplicationCommand():
+    pass
+
+class WindowCommand():
+    def __init__(self, window):
+        self.window = window
+
+class TextCommand():
+    def __init__(self, view):
+        self.view = view
+
+class EventListener():
+    pass
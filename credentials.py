@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+# The HTTP and Rdio modules are only imported when something is checked, so that
+# loading saved verdicts at start up stays cheap.
+
+# HTTP statuses the API answers with when the key or secret is wrong.
+AUTH_FAILURE_STATUSES = (401,)
+# Mashery answers 403 both when it won't accept a key and when a key is over its
+# rate or QPS limit, which says nothing about the key. These, found in the reason,
+# the X-Mashery-Error-Code header or the body, are the ones that reject it.
+AUTH_FAILURE_403_ERRORS = ("developer inactive", "not authorized", "account inactive")
+
+def is_auth_failure(error):
+    try:
+        from urllib.error import HTTPError
+    except ImportError:
+        from urllib2 import HTTPError
+    if not isinstance(error, HTTPError):
+        return False
+    if error.code in AUTH_FAILURE_STATUSES:
+        return True
+    if error.code != 403:
+        return False
+    try:
+        body = error.read().decode('utf-8', 'replace')
+    except Exception:
+        body = ""
+    headers = getattr(error, "headers", None)
+    code = (headers.get("X-Mashery-Error-Code") or "") if headers is not None else ""
+    text = " ".join([str(error.reason), code, body]).lower().replace("_", " ")
+    return any(phrase in text for phrase in AUTH_FAILURE_403_ERRORS)
+
+class CredentialValidator():
+    """
+    Check whether an Rdio API key and secret work without blocking the caller.
+
+    Verdicts are saved to cache_file, keyed by a hash of the key and secret, and
+    are trusted for max_age seconds if they're good. A bad verdict is checked
+    again every time it's asked about, so fixing the key doesn't mean waiting.
+    Until a pair has been checked it is assumed to be valid, and network
+    problems never change the verdict - only the API actually rejecting the
+    credentials does.
+    """
+    def __init__(self, key, secret, cache_file, max_age=7*24*60*60):
+        self.key = key or ""
+        self.secret = secret or ""
+        self.cache_file = cache_file
+        self.max_age = max_age
+        self.fingerprint = hashlib.sha256((self.key + "\0" + self.secret).encode('utf-8')).hexdigest()
+
+        self._lock = threading.Lock()
+        self._validating = False
+        self._entry = self._load().get(self.fingerprint)
+
+    def is_valid(self):
+        if not self.key or not self.secret:
+            return False
+        if self._entry is None:
+            return True
+        return self._entry["valid"]
+
+    def needs_validation(self):
+        if not self.key or not self.secret:
+            return False
+        if self._entry is None or not self._entry["valid"]:
+            return True
+        return time.time() - self._entry["checked"] > self.max_age
+
+    def validate_async(self, callback=None):
+        """
+        Check the credentials against the API on a background thread, then call
+        callback(is_valid) if the verdict is known.
+        """
+        with self._lock:
+            if self._validating: return
+            self._validating = True
+        t = threading.Thread(target=self._validate, args=(callback,))
+        t.daemon = True
+        t.start()
+
+    def record(self, valid):
+        """ Remember a verdict, e.g. after an API call was rejected. """
+        self._entry = {"valid": valid, "checked": time.time()}
+        with self._lock:
+            entries = self._load()
+            entries[self.fingerprint] = self._entry
+            try:
+                if not os.path.exists(os.path.dirname(self.cache_file)):
+                    os.makedirs(os.path.dirname(self.cache_file))
+                with open(self.cache_file, "w") as f:
+                    json.dump(entries, f)
+            except (IOError, OSError):
+                pass
+
+    def _validate(self, callback):
+        try:
+            from Rdio.rdio import Rdio
+        except:
+            from rdio import Rdio
+        try:
+            Rdio((self.key, self.secret)).call("get", {"keys":""})
+            valid = True
+        except Exception as e:
+            valid = False if is_auth_failure(e) else None
+        with self._lock:
+            self._validating = False
+        if valid is None: return # Couldn't tell, keep what we had.
+        self.record(valid)
+        if callback: callback(valid)
+
+    def _load(self):
+        try:
+            with open(self.cache_file) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
@@ -0,0 +1,113 @@
+import threading
+from concurrent.futures import Future
+
+class LoadError(Exception):
+    """ Rdio answered a batched get with an error. """
+    pass
+
+class KeyLoader():
+    """
+    Looks up Rdio objects by key, batching lookups into as few `get` calls as possible.
+
+    Keys asked for within window seconds of each other, from any thread, are fetched
+    together: duplicates are dropped, large batches are split into chunks of at most
+    max_keys keys, and the chunks are fetched concurrently on rdio's pool. Each caller
+    gets a future of just the objects it asked for.
+
+        loader = KeyLoader(rdio)
+        album = loader.load("a123", extras="tracks").result() # album["tracks"] is embedded
+
+    Lookups with different extras are batched separately.
+    """
+    def __init__(self, rdio, window=0.005, max_keys=100):
+        self.rdio = rdio
+        self.window = window
+        self.max_keys = max_keys
+
+        self._pending = {} # extras -> [(keys, future)]
+        self._lock = threading.Lock()
+        self.stats = {"lookups": 0, "batches": 0, "requests": 0}
+
+    def load(self, key, extras=None, token=None):
+        """ Return a future of the object for key, or None if Rdio doesn't know it. """
+        loaded = self.load_many([key], extras, token)
+        future = Future()
+        def done(f):
+            if f.cancelled():
+                future.cancel()
+            elif not future.set_running_or_notify_cancel():
+                return
+            elif f.exception() is not None:
+                future.set_exception(f.exception())
+            else:
+                future.set_result(f.result().get(key))
+        loaded.add_done_callback(done)
+        return future
+
+    def load_many(self, keys, extras=None, token=None):
+        """ Return a future of a dict from each of keys that Rdio knows to its object. """
+        future = Future()
+        with self._lock:
+            self.stats["lookups"] += 1
+            batch = self._pending.get(extras)
+            if batch is None:
+                batch = self._pending[extras] = []
+                timer = threading.Timer(self.window, self._dispatch, (extras,))
+                timer.daemon = True
+                timer.start()
+            batch.append((list(keys), future))
+        if token is not None:
+            token.add(future)
+        return future
+
+    def _dispatch(self, extras):
+        with self._lock:
+            batch = self._pending.pop(extras)
+            self.stats["batches"] += 1
+        # Callers who have given up by now don't need their keys fetched.
+        batch = [(keys, future) for keys, future in batch if not future.cancelled()]
+        if not batch: return
+
+        keys = []
+        seen = set()
+        for waiter_keys, _ in batch:
+            for key in waiter_keys:
+                if key not in seen:
+                    seen.add(key)
+                    keys.append(key)
+        chunks = [keys[i:i+self.max_keys] for i in range(0, len(keys), self.max_keys)]
+        if not chunks:
+            self._deliver(batch, {}, None)
+            return
+
+        results = {}
+        remaining = [len(chunks)]
+        errors = []
+        lock = threading.Lock()
+        def chunk_done(f):
+            with lock:
+                if f.exception() is not None:
+                    errors.append(f.exception())
+                elif f.result().get("status") != "ok":
+                    errors.append(LoadError(f.result().get("message", "Rdio internal server error.")))
+                else:
+                    results.update(f.result()["result"])
+                remaining[0] -= 1
+                if remaining[0]: return
+            self._deliver(batch, results, errors[0] if errors else None)
+
+        for chunk in chunks:
+            params = {"keys": ", ".join(chunk)}
+            if extras: params["extras"] = extras
+            with self._lock:
+                self.stats["requests"] += 1
+            self.rdio.call_async("get", params).add_done_callback(chunk_done)
+
+    def _deliver(self, batch, results, error):
+        for keys, future in batch:
+            # Once running, a future can't be cancelled, so this can't race with the caller giving up.
+            if not future.set_running_or_notify_cancel(): continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(dict((k, results[k]) for k in keys if k in results))
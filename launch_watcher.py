@@ -0,0 +1,61 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import sublime
+
+sublime3 = int(sublime.version()) >= 3000
+if sublime3:
+    set_timeout_async = sublime.set_timeout_async
+else:
+    set_timeout_async = sublime.set_timeout
+
+class LaunchWatcher():
+    """
+    Launches an app if it isn't running and finds out when it's ready.
+
+    ready() returns a future that becomes True once the app is running, or False if that
+    takes more than timeout seconds. The first check is launch(), which should launch the
+    app unless it's running and return whether it was, and after that is_running(). Until
+    the future is done, everyone who calls ready() gets the same one, so there's only ever
+    one launch and one series of checks. The checks start first_delay seconds apart and
+    double up to max_delay, on Sublime's async thread.
+
+        watcher = LaunchWatcher(lambda: player.probe().running, launch_unless_running)
+        watcher.ready().add_done_callback(lambda ready: ready.result() and play())
+    """
+    def __init__(self, is_running, launch, first_delay=0.1, max_delay=2.0, timeout=60.0):
+        self.is_running = is_running
+        self.launch = launch
+        self.first_delay = first_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+
+        self._future = None
+        self._lock = threading.Lock()
+        self.stats = {"waits": 0, "launches": 0, "checks": 0}
+
+    def ready(self):
+        """ A future that becomes True when the app is running, launching it if need be. """
+        with self._lock:
+            self.stats["waits"] += 1
+            if self._future is not None and not self._future.done():
+                return self._future
+            future = self._future = Future()
+        set_timeout_async(lambda: self._check(future, None, 0), 0)
+        return future
+
+    def _check(self, future, deadline, delay):
+        self.stats["checks"] += 1
+        running = self.launch() if deadline is None else self.is_running()
+        if running:
+            future.set_result(True)
+            return
+        if deadline is None:
+            self.stats["launches"] += 1
+            deadline = time.monotonic() + self.timeout
+        elif time.monotonic() >= deadline:
+            future.set_result(False)
+            return
+        delay = min(delay * 2, self.max_delay) if delay else self.first_delay
+        set_timeout_async(lambda: self._check(future, deadline, delay), int(delay * 1000))
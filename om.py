@@ -52,9 +52,15 @@ except ImportError:
 
 import sys
 
+try:
+  from Rdio.perf import timed
+except ImportError:
+  from perf import timed
+
 PY3 = (sys.version_info >= (3, 0, 0))
 
 
+@timed('om')
 def om(consumer, url, post_params, token=None, method='POST', realm=None, timestamp=None, nonce=None):
   """A one-shot simple OAuth signature generator"""
 
@@ -137,3 +143,110 @@ def om(consumer, url, post_params, token=None, method='POST', realm=None, timest
   authorization_params.extend([p for p in params if p[0] in oauth_params])
 
   return 'OAuth ' + (', '.join(['%s="%s"'%p for p in authorization_params]))
+
+
+# Parameters that go in the Authorization header, as opposed to just the signature.
+OAUTH_PARAMS = frozenset(('oauth_version', 'oauth_timestamp', 'oauth_nonce',
+                          'oauth_signature_method', 'oauth_signature',
+                          'oauth_consumer_key', 'oauth_token'))
+
+
+def _escape(s):
+  # UTF-8 and escape a key or value
+  return quote(s.encode('utf-8'), safe='~'.encode('utf-8'))
+
+
+class OAuthSigner(object):
+  """A reusable version of om() bound to a consumer and token.
+
+  Everything that doesn't change between requests is worked out once: the
+  normalized form of each URL, the escaped OAuth parameters and the keyed
+  HMAC-SHA1, which is copied for each request. The Authorization header is
+  byte-for-byte the same as om() produces for the same arguments.
+
+    signer = OAuthSigner((consumer_key, consumer_secret), token)
+    auth = signer.sign(url, params)
+  """
+
+  def __init__(self, consumer, token=None):
+    self.consumer = consumer
+    self.token = token
+
+    # OAuth params that are the same for every request.
+    self.__constant_params = [
+      ('oauth_version', '1.0'),
+      ('oauth_signature_method', 'HMAC-SHA1'),
+      ('oauth_consumer_key', consumer[0]),
+    ]
+    hmac_key = consumer[1] + '&'
+    if token is not None:
+      self.__constant_params.append(('oauth_token', token[0]))
+      hmac_key += token[1]
+    self.__hmac = hmac.new(hmac_key.encode('utf-8'), digestmod=hashlib.sha1)
+
+    # Escaped forms of strings seen before: parameter names and constant values.
+    self.__escaped = {}
+    for k, v in self.__constant_params + [('oauth_timestamp', ''), ('oauth_nonce', '')]:
+      self.__escaped[k] = _escape(k)
+      self.__escaped[v] = _escape(v)
+    # (method, url) -> (escaped "METHOD&URL&" prefix, query string params)
+    self.__urls = {}
+
+  def __escape(self, s, remember=False):
+    escaped = self.__escaped.get(s)
+    if escaped is None:
+      escaped = _escape(s)
+      if remember and len(self.__escaped) < 1024:
+        self.__escaped[s] = escaped
+    return escaped
+
+  def __url(self, method, url):
+    cached = self.__urls.get((method, url))
+    if cached is None:
+      # normalize the URL, exactly as om() does
+      scheme, netloc, path, _, query = urlparse(url)[:5]
+      # Exclude default port numbers.
+      if scheme == 'http' and netloc[-3:] == ':80':
+        netloc = netloc[:-3]
+      elif scheme == 'https' and netloc[-4:] == ':443':
+        netloc = netloc[:-4]
+      netloc = netloc.lower()
+      normalized_url = '%s://%s%s' % (scheme, netloc, path)
+      cached = (_escape(method) + '&' + _escape(normalized_url) + '&', parse_qsl(query))
+      self.__urls[(method, url)] = cached
+    return cached
+
+  @timed('OAuthSigner.sign')
+  def sign(self, url, post_params, method='POST', realm=None, timestamp=None, nonce=None):
+    """Return the Authorization header for POSTing post_params to url. See om()."""
+    method = method.upper()
+    prefix, query_params = self.__url(method, url)
+
+    if isinstance(post_params, list):
+      params = list(post_params)
+    else:
+      params = list(post_params.items())
+    params.extend(query_params)
+    params.extend(self.__constant_params)
+    params.append(('oauth_timestamp', timestamp if timestamp is not None else str(int(time.time()))))
+    params.append(('oauth_nonce', nonce if nonce is not None else str(random.randint(0, 1000000))))
+
+    # Sort lexicographically, first after key, then after value.
+    params.sort()
+    escape = self.__escape
+    params = [(escape(k, True), escape(v)) for k, v in params]
+    normalized_params = '&'.join(['%s=%s' % p for p in params])
+
+    hashed = self.__hmac.copy()
+    hashed.update((prefix + _escape(normalized_params)).encode('utf-8'))
+    oauth_signature = binascii.b2a_base64(hashed.digest())[:-1]
+    if PY3:
+      oauth_signature = oauth_signature.decode('utf-8')
+
+    # Build the Authorization header
+    authorization_params = [('oauth_signature', oauth_signature)]
+    if realm is not None:
+      authorization_params.insert(0, ('realm', _escape(realm)))
+    authorization_params.extend([p for p in params if p[0] in OAUTH_PARAMS])
+
+    return 'OAuth ' + (', '.join(['%s="%s"' % p for p in authorization_params]))
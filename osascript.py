@@ -0,0 +1,168 @@
+import threading
+from subprocess import Popen, PIPE, DEVNULL
+
+# JavaScript for Automation program run by the persistent osascript process.
+# It reads framed AppleScript source from stdin ("<length>\n<utf-8 source>"),
+# runs it with NSAppleScript and writes a framed reply to stdout
+# ("<ok|error> <length>\n<utf-8 result>"). Results are formatted the same way
+# `osascript -` prints them so callers can't tell the two modes apart.
+SERVER_SCRIPT = r"""
+ObjC.import('Foundation');
+var stdin = $.NSFileHandle.fileHandleWithStandardInput;
+var stdout = $.NSFileHandle.fileHandleWithStandardOutput;
+
+function decode(data) {
+    return $.NSString.alloc.initWithDataEncoding(data, $.NSUTF8StringEncoding).js;
+}
+
+function readHeader() {
+    var chars = [];
+    while (true) {
+        var c = stdin.readDataOfLength(1);
+        if (c.length == 0) return null;
+        c = decode(c);
+        if (c == '\n') return chars.join('');
+        chars.push(c);
+    }
+}
+
+function format(desc) {
+    if (desc.isNil()) return '';
+    switch (desc.descriptorType) {
+        case 0x6C697374: // 'list'
+            var items = [];
+            for (var i = 1; i <= desc.numberOfItems; i++) items.push(format(desc.descriptorAtIndex(i)));
+            return items.join(', ');
+        case 0x74727565: return 'true';  // 'true'
+        case 0x66616C73: return 'false'; // 'fals'
+        case 0x626F6F6C: return desc.booleanValue ? 'true' : 'false'; // 'bool'
+        case 0x6D736E67: return 'missing value'; // 'msng'
+    }
+    var s = desc.stringValue;
+    return s.isNil() ? '' : s.js;
+}
+
+function reply(status, text) {
+    var body = $(text).dataUsingEncoding($.NSUTF8StringEncoding);
+    stdout.writeData($(status + ' ' + body.length + '\n').dataUsingEncoding($.NSUTF8StringEncoding));
+    stdout.writeData(body);
+}
+
+while (true) {
+    var header = readHeader();
+    if (header === null) break;
+    var length = parseInt(header, 10);
+    var source = length > 0 ? decode(stdin.readDataOfLength(length)) : '';
+    var error = Ref();
+    var result = $.NSAppleScript.alloc.initWithSource(source).executeAndReturnError(error);
+    if (result.isNil()) {
+        var message = '';
+        try { message = ObjC.unwrap(error[0].objectForKey('NSAppleScriptErrorMessage')) || ''; } catch (e) {}
+        reply('error', message);
+    } else {
+        reply('ok', format(result));
+    }
+}
+"""
+
+def run_script(cmd, command=None):
+    """
+    Run a single AppleScript by spawning a new osascript process.
+    Returns the output without its trailing newline, or "" if the script failed.
+    """
+    command = command or ["osascript"]
+    p = Popen(command + ['-'], stdin=PIPE, stdout=PIPE, stderr=PIPE)
+    # osascript reads its source as UTF-8, like the coprocess below.
+    stdout, stderr = p.communicate(cmd.encode('utf-8'))
+    # Only the newline: strip() would also take trailing FIELD_SEPARATORs (empty fields) with it.
+    return stdout.decode('utf-8').rstrip("\n")
+
+class OsascriptCoprocess():
+    """
+    Keep one long-lived osascript interpreter around and feed it scripts over a pipe.
+
+    This avoids a fork/exec and interpreter start up for every script, which
+    dominates the cost of polling the player several times a second.
+    If the process has died (or the pipe breaks) by the time a script is sent,
+    it is restarted and the script sent again, once. If it dies after the script
+    was sent, the script may have run, so it isn't retried and "" is returned.
+
+    `command` is the interpreter to run, e.g. ["osascript"] or a stand-in
+    that speaks the same protocol (see benchmarks/fake_osascript.py).
+    """
+    def __init__(self, command=None):
+        self.command = command or ["osascript"]
+        self._process = None
+        self._lock = threading.Lock()
+
+        self.scripts_run = 0
+        self.restarts = 0
+
+    def execute(self, cmd):
+        """ Return the output of the AppleScript cmd without a trailing newline, or "" if the script failed. """
+        with self._lock:
+            self.scripts_run += 1
+            try:
+                process = self._send(cmd)
+            except (IOError, OSError, ValueError):
+                # The script never got to the interpreter, so it can't have run yet.
+                self._kill()
+                self.restarts += 1
+                try:
+                    process = self._send(cmd)
+                except (IOError, OSError, ValueError):
+                    self._kill()
+                    return ""
+            try:
+                return self._receive(process)
+            except (IOError, OSError, ValueError):
+                # It may have run before the interpreter died, and running it
+                # again could e.g. skip a track twice.
+                self._kill()
+                return ""
+
+    def close(self):
+        with self._lock:
+            self._kill()
+
+    def _send(self, cmd):
+        process = self._ensure_process()
+        payload = cmd.encode('utf-8')
+        process.stdin.write(str(len(payload)).encode('ascii') + b"\n" + payload)
+        process.stdin.flush()
+        return process
+
+    def _receive(self, process):
+        header = process.stdout.readline()
+        if not header.endswith(b"\n"):
+            raise IOError("osascript coprocess exited")
+        status, length = header.decode('ascii').split()
+        body = process.stdout.read(int(length))
+        if len(body) != int(length):
+            raise IOError("osascript coprocess exited")
+
+        if status != "ok": return ""
+        return body.decode('utf-8').rstrip("\n")
+
+    def _ensure_process(self):
+        if self._process is not None and self._process.poll() is not None:
+            self._kill()
+            self.restarts += 1
+        if self._process is None:
+            self._process = Popen(self.command + ['-l', 'JavaScript', '-e', SERVER_SCRIPT],
+                stdin=PIPE, stdout=PIPE, stderr=DEVNULL)
+        return self._process
+
+    def _kill(self):
+        if self._process is None: return
+        try:
+            self._process.kill()
+            self._process.wait()
+        except OSError:
+            pass
+        for f in (self._process.stdin, self._process.stdout, self._process.stderr):
+            try:
+                if f: f.close()
+            except (IOError, OSError):
+                pass
+        self._process = None
@@ -0,0 +1,89 @@
+import functools
+import json
+import threading
+import time
+
+# Turned on by the "enable_perf_stats" setting. While it's off, timed functions
+# only pay for checking it.
+enabled = False
+
+SAMPLES_KEPT = 512
+
+class Timings():
+    """ The number and total time of calls to something, and the latency of the last SAMPLES_KEPT. """
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.samples = [0.0] * SAMPLES_KEPT # ring buffer
+        self._next = 0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.samples[self._next] = seconds
+        self._next = (self._next + 1) % SAMPLES_KEPT
+
+    def summary(self):
+        """ A dict of the count, and mean, p50, p95, p99 and max latency in ms. """
+        recent = sorted(self.samples[:min(self.count, SAMPLES_KEPT)])
+        def percentile(p):
+            return recent[min(len(recent) - 1, int(len(recent) * p))] * 1000 if recent else 0.0
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "max_ms": recent[-1] * 1000 if recent else 0.0,
+        }
+
+_timings = {} # name -> Timings
+_lock = threading.Lock()
+
+def record(name, seconds):
+    """ Record that name took seconds, whether or not timing is enabled. """
+    with _lock:
+        timings = _timings.get(name)
+        if timings is None:
+            timings = _timings[name] = Timings()
+        timings.add(seconds)
+
+def timed(name):
+    """ Decorate a function to record how long calls to it take under name, while timing is enabled. """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+def stats():
+    """ A dict from each name recorded to its Timings.summary(). """
+    with _lock:
+        return dict((name, timings.summary()) for name, timings in _timings.items())
+
+def reset():
+    with _lock:
+        _timings.clear()
+
+def report():
+    """ stats() as a table, slowest (by total time) first. """
+    rows = sorted(stats().items(), key=lambda item: -item[1]["count"] * item[1]["mean_ms"])
+    width = max([len(name) for name, _ in rows] + [4])
+    lines = ["%-*s %8s %9s %9s %9s %9s %9s" % (width, "name", "count", "mean ms", "p50 ms", "p95 ms", "p99 ms", "max ms")]
+    for name, s in rows:
+        lines.append("%-*s %8d %9.2f %9.2f %9.2f %9.2f %9.2f" % (width, name, s["count"], s["mean_ms"],
+            s["p50_ms"], s["p95_ms"], s["p99_ms"], s["max_ms"]))
+    return "\n".join(lines)
+
+def export(path, counters=None):
+    """ Write stats(), and any other counters (a JSON-able dict), to path as JSON. """
+    with open(path, "w") as f:
+        json.dump({"time": time.time(), "enabled": enabled, "stats": stats(), "counters": counters or {}},
+                  f, indent=2, sort_keys=True)
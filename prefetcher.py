@@ -0,0 +1,90 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+from Rdio.rdio import canonical_params
+
+class Prefetcher():
+    """
+    Makes API calls the user is likely to need next, in the background, and keeps the responses
+    around for a little while.
+
+    At most max_concurrent calls run at once, on the prefetcher's own threads so they never hold up
+    calls made on AsyncRdio's pool, and at most budget calls are started a minute. Asking for new
+    calls drops the ones that haven't started yet. The last max_entries ok responses are kept for
+    ttl seconds; identical calls made while a prefetch is in flight share its request anyway.
+    """
+    def __init__(self, rdio, max_concurrent=2, budget=30, max_entries=32, ttl=300):
+        self.rdio = rdio
+        self.max_concurrent = max_concurrent
+        self.budget = budget
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._pending = [] # [(key, method, params)], next first
+        self._running = set()
+        self._started = deque() # times calls were started in the last minute
+        self._responses = OrderedDict() # key -> (expires, response)
+        self._lock = threading.Lock()
+        self.stats = {"prefetches": 0, "hits": 0, "misses": 0, "over_budget": 0}
+
+    def prefetch(self, calls):
+        """ Start fetching calls, a list of (method, params), replacing any that haven't started. """
+        with self._lock:
+            self._pending = []
+            now = time.time()
+            for method, params in calls:
+                key = (method, canonical_params(params))
+                entry = self._responses.get(key)
+                if key in self._running or (entry is not None and entry[0] > now): continue
+                if key not in [pending[0] for pending in self._pending]:
+                    self._pending.append((key, method, params))
+            self._start()
+
+    def cancel(self):
+        """ Drop the calls that haven't started. """
+        with self._lock:
+            self._pending = []
+
+    def get(self, method, params):
+        """ Return the prefetched response to a call, or None. """
+        key = (method, canonical_params(params))
+        with self._lock:
+            entry = self._responses.get(key)
+            if entry is None or entry[0] <= time.time():
+                self.stats["misses"] += 1
+                return None
+            self._responses.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def _start(self):
+        now = time.time()
+        while self._started and self._started[0] <= now - 60:
+            self._started.popleft()
+        while self._pending and len(self._running) < self.max_concurrent:
+            if len(self._started) >= self.budget:
+                self.stats["over_budget"] += len(self._pending)
+                self._pending = []
+                return
+            key, method, params = self._pending.pop(0)
+            self._running.add(key)
+            self._started.append(now)
+            self.stats["prefetches"] += 1
+            t = threading.Thread(target=self._fetch, args=(key, method, params))
+            t.daemon = True
+            t.start()
+
+    def _fetch(self, key, method, params):
+        try:
+            response = self.rdio.call(method, params)
+        except Exception:
+            response = None
+        with self._lock:
+            self._running.discard(key)
+            if response is not None and response.get("status") == "ok":
+                self._responses[key] = (time.time() + self.ttl, response)
+                self._responses.move_to_end(key)
+                while len(self._responses) > self.max_entries:
+                    self._responses.popitem(last=False)
+            self._start()
@@ -19,38 +19,217 @@
 
 from __future__ import unicode_literals
 
-from Rdio.om import om
+from Rdio.om import OAuthSigner
+from Rdio.perf import timed
 try:
-    from urllib.request import urlopen, Request
-    from urllib.parse import urlencode
+    from urllib.error import HTTPError
+    from urllib.parse import urlencode, urlsplit
     from urllib.parse import parse_qsl
+    from urllib.request import urlopen, Request, getproxies, proxy_bypass
+    from http.client import HTTPConnection, HTTPSConnection, HTTPException
 except ImportError:
-    from urllib2 import urlopen, Request
-    from urllib import urlencode
-    from urlparse import parse_qsl
+    from urllib2 import HTTPError, urlopen, Request
+    from urllib import urlencode, getproxies, proxy_bypass
+    from urlparse import parse_qsl, urlsplit
+    from httplib import HTTPConnection, HTTPSConnection, HTTPException
 
+import io
 import json
+import socket
+import threading
+import zlib
+
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+
+class ConnectionPool:
+  """Keep-alive HTTP connections, shared by every Rdio instance.
+
+  Connections are reused across requests to the same host. If a reused
+  connection turns out to have been closed by the server, the request is
+  retried once on a fresh connection. Responses are requested gzipped.
+
+  Requests to hosts that should go through a proxy (the http_proxy environment
+  variables, or the system settings on OS X) are made with urlopen instead,
+  which knows how to use one, and don't get kept alive.
+  """
+  def __init__(self, max_idle_per_host=4, timeout=30):
+    self.max_idle_per_host = max_idle_per_host
+    self.timeout = timeout
+    self.__idle = {}
+    self.__proxies = None # from getproxies(), looked up on the first request
+    self.__proxied = {} # (scheme, netloc) -> whether to use the proxy
+    self.__lock = threading.Lock()
+    self.stats = {'requests': 0, 'connections_opened': 0, 'connections_reused': 0,
+                  'stale_retries': 0, 'proxied_requests': 0, 'bytes_received': 0, 'bytes_decoded': 0}
+
+  def __get(self, scheme, netloc):
+    with self.__lock:
+      idle = self.__idle.get((scheme, netloc))
+      if idle:
+        self.stats['connections_reused'] += 1
+        return idle.pop(), True
+      self.stats['connections_opened'] += 1
+    cls = HTTPSConnection if scheme == 'https' else HTTPConnection
+    return cls(netloc, timeout=self.timeout), False
+
+  def __put(self, scheme, netloc, conn):
+    with self.__lock:
+      idle = self.__idle.setdefault((scheme, netloc), [])
+      if len(idle) < self.max_idle_per_host:
+        idle.append(conn)
+        return
+    conn.close()
+
+  def close(self):
+    with self.__lock:
+      idle, self.__idle = self.__idle, {}
+    for conns in idle.values():
+      for conn in conns:
+        conn.close()
+
+  def post(self, url, body, headers):
+    """POST body to url and return the decoded response body as bytes.
+
+    Raises HTTPError for non-2xx responses, like urlopen.
+    """
+    scheme, netloc, path, query, _ = urlsplit(url)
+    if query:
+      path += '?' + query
+    headers = dict(headers)
+    headers['Accept-Encoding'] = 'gzip'
+    self.stats['requests'] += 1
+    if self.__use_proxy(scheme, netloc):
+      status, reason, msg, data = self.__post_via_proxy(url, body, headers)
+    else:
+      status, reason, msg, data = self.__post_direct(scheme, netloc, path, body, headers)
+
+    self.stats['bytes_received'] += len(data)
+    if (msg.get('Content-Encoding') or '').lower() == 'gzip':
+      data = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+    self.stats['bytes_decoded'] += len(data)
+    if not 200 <= status < 300:
+      raise HTTPError(url, status, reason, msg, io.BytesIO(data))
+    return data
+
+  def __use_proxy(self, scheme, netloc):
+    key = (scheme, netloc)
+    if key not in self.__proxied:
+      if self.__proxies is None:
+        self.__proxies = getproxies()
+      self.__proxied[key] = scheme in self.__proxies and not proxy_bypass(netloc.split(':')[0])
+    return self.__proxied[key]
+
+  def __post_via_proxy(self, url, body, headers):
+    self.stats['proxied_requests'] += 1
+    try:
+      res = urlopen(Request(url, body, headers), timeout=self.timeout)
+    except HTTPError as e:
+      res = e
+    try:
+      return res.getcode(), res.reason, res.info(), res.read()
+    finally:
+      res.close()
+
+  def __post_direct(self, scheme, netloc, path, body, headers):
+    while True:
+      conn, reused = self.__get(scheme, netloc)
+      try:
+        conn.request('POST', path or '/', body, headers)
+        res = conn.getresponse()
+        data = res.read()
+      except (HTTPException, socket.error):
+        conn.close()
+        if reused:
+          # The server closed the idle connection under us, try again on a new one.
+          self.stats['stale_retries'] += 1
+          continue
+        raise
+      if res.will_close:
+        conn.close()
+      else:
+        self.__put(scheme, netloc, conn)
+      return res.status, res.reason, res.msg, data
+
+connection_pool = ConnectionPool()
+
+class SingleFlight:
+  """Lets concurrent calls with the same key share one execution.
+
+  The first caller for a key runs the function; callers that arrive while it
+  is running wait for it and get the same result (or exception). The result
+  is shared, so callers must not modify it.
+  """
+  def __init__(self):
+    self.__calls = {}
+    self.__lock = threading.Lock()
+    self.stats = {'calls': 0, 'coalesced': 0}
+
+  def do(self, key, fn):
+    with self.__lock:
+      self.stats['calls'] += 1
+      call = self.__calls.get(key)
+      leader = call is None
+      if leader:
+        call = self.__calls[key] = {'done': threading.Event(), 'result': None, 'error': None}
+      else:
+        self.stats['coalesced'] += 1
+
+    if not leader:
+      call['done'].wait()
+      if call['error'] is not None:
+        raise call['error']
+      return call['result']
+
+    try:
+      call['result'] = fn()
+      return call['result']
+    except Exception as e:
+      call['error'] = e
+      raise
+    finally:
+      with self.__lock:
+        del self.__calls[key]
+      call['done'].set()
+
+singleflight = SingleFlight()
+
+parse_response = timed('json.loads')(json.loads)
+
+def canonical_params(params):
+  """A hashable form of params that doesn't depend on their order."""
+  return json.dumps(params, sort_keys=True)
 
 class Rdio:
-  def __init__(self, consumer, token=None):
+  api_root = 'http://api.rdio.com'
+
+  def __init__(self, consumer, token=None, cache=None):
     self.__consumer = consumer
+    self.__signer = None
     self.token = token
+    # something like response_cache.ResponseCache, used for calls made without a token
+    self.cache = cache
     self.content_type = 'application/x-www-form-urlencoded;charset=utf-8'
 
+  def __get_signer(self):
+    # the token changes during authentication
+    if self.__signer is None or self.__signer.token != self.token:
+      self.__signer = OAuthSigner(self.__consumer, self.token)
+    return self.__signer
+
+  @timed('Rdio.__signed_post')
   def __signed_post(self, url, params):
-    auth = om(self.__consumer, url, params, self.token)
-    # Second parameter to Request should be a bytes (Python3) or str (Python2)
+    auth = self.__get_signer().sign(url, params)
+    # Request bodies should be a bytes (Python3) or str (Python2)
     # Since we are using unicode everywhere, we should do an encode
     # and set Content-Type header accordingly
-    req = Request(url, urlencode(params).encode('utf-8'),
-                  {'Authorization': auth, 'Content-Type': self.content_type})
-    res = urlopen(req)
+    body = urlencode(params).encode('utf-8')
+    res = connection_pool.post(url, body, {'Authorization': auth, 'Content-Type': self.content_type})
     # return unicode instead of bytes
-    return res.read().decode('utf-8')
+    return res.decode('utf-8')
 
   def begin_authentication(self, callback_url):
     # request a request token from the server
-    response = self.__signed_post('http://api.rdio.com/oauth/request_token',
+    response = self.__signed_post(self.api_root + '/oauth/request_token',
       {'oauth_callback': callback_url})
     # parse the response
     parsed = dict(parse_qsl(response))
@@ -61,7 +240,7 @@ class Rdio:
 
   def complete_authentication(self, verifier):
     # request an access token
-    response = self.__signed_post('http://api.rdio.com/oauth/access_token',
+    response = self.__signed_post(self.api_root + '/oauth/access_token',
         {'oauth_verifier': verifier})
     # parse the response
     parsed = dict(parse_qsl(response))
@@ -69,10 +248,96 @@ class Rdio:
     self.token = (parsed['oauth_token'], parsed['oauth_token_secret'])
 
   def call(self, method, params=dict()):
+    cache = self.cache if self.token is None else None
+    if cache is not None:
+      response = cache.get(method, params)
+      if response is not None:
+        return response
     # make a copy of the dict
     params = dict(params)
     # put the method in the dict
     params['method'] = method
-    # call to the server and parse the response
-    return json.loads(self.__signed_post('http://api.rdio.com/1/', params))
+    # call to the server and parse the response, sharing the request with
+    # any identical call that's already in flight
+    key = (self.__consumer, self.token, self.api_root, canonical_params(params))
+    response = singleflight.do(key, lambda: parse_response(self.__signed_post(self.api_root + '/1/', params)))
+    if cache is not None and response.get('status') == 'ok':
+      del params['method']
+      cache.put(method, params, response)
+    return response
+
+
+
+class CancellationToken(object):
+  """Marks a group of AsyncRdio requests as no longer wanted.
+
+  Cancelling stops requests that haven't been sent yet from being sent, and
+  makes the futures of requests already in flight end up cancelled instead
+  of delivering their (now stale) results.
+  """
+  def __init__(self):
+    self.cancelled = False
+    self.__futures = []
+    self.__lock = threading.Lock()
+
+  def add(self, future):
+    with self.__lock:
+      self.__futures = [f for f in self.__futures if not f.done()]
+      self.__futures.append(future)
+      cancelled = self.cancelled
+    if cancelled:
+      future.cancel()
+
+  def cancel(self):
+    with self.__lock:
+      self.cancelled = True
+      futures, self.__futures = self.__futures, []
+    for future in futures:
+      future.cancel()
+
+  def check(self):
+    if self.cancelled:
+      raise CancelledError()
+
+
+class AsyncRdio(Rdio):
+  """An Rdio client whose calls run in the background and return futures.
+
+  Every AsyncRdio shares one small pool of worker threads, so the number of
+  threads stays bounded however many requests are made.
+
+    token = CancellationToken()
+    future = rdio.call_async('search', {'query': 'radiohead'}, token)
+    future.add_done_callback(...)
+    token.cancel() # e.g. when the user searches for something else
+  """
+  max_workers = 4
+  __executor = None
+  __executor_lock = threading.Lock()
+
+  @classmethod
+  def executor(cls):
+    with AsyncRdio.__executor_lock:
+      if AsyncRdio.__executor is None:
+        AsyncRdio.__executor = ThreadPoolExecutor(max_workers=cls.max_workers)
+      return AsyncRdio.__executor
+
+  def submit(self, fn, token=None):
+    """Run fn(self) on the shared pool and return a future of its result.
+
+    If token is cancelled before fn starts, fn never runs. fn may call
+    token.check() between calls to give up early.
+    """
+    def run():
+      if token is not None: token.check()
+      result = fn(self)
+      if token is not None: token.check()
+      return result
+    future = self.executor().submit(run)
+    if token is not None:
+      token.add(future)
+    return future
 
+  def call_async(self, method, params=dict(), token=None):
+    """Like call, but returns a future of the parsed response."""
+    return self.submit(lambda rdio: rdio.call(method, params), token)
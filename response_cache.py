@@ -0,0 +1,128 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import sqlite3
+except ImportError:
+    # Some builds of Sublime Text 3 ship without sqlite3, in which case only the in-memory tier is used.
+    sqlite3 = None
+
+DAY = 24 * 60 * 60
+
+# How long responses to each (cacheable) API method stay fresh, in seconds.
+DEFAULT_TTLS = {
+    "get": 30 * DAY,
+    "getTracksForArtist": 7 * DAY,
+    "getAlbumsForArtist": 7 * DAY,
+}
+
+def cache_key(method, params):
+    return method + ":" + json.dumps(params, sort_keys=True)
+
+class ResponseCache():
+    """
+    A persistent cache of catalog API responses, which hardly ever change.
+
+    Responses live in a SQLite database at path, keyed by method and canonical params,
+    and expire after a per-method TTL. When the database grows past max_bytes the least
+    recently used responses are evicted. The most recently used responses are also kept
+    in memory so repeat lookups don't touch the disk.
+    """
+    def __init__(self, path, ttls=None, max_bytes=20*1024*1024, hot_entries=128):
+        self.path = path
+        self.ttls = ttls or DEFAULT_TTLS
+        self.max_bytes = max_bytes
+        self.hot_entries = hot_entries
+
+        self._hot = OrderedDict() # key -> (expires, response)
+        self._lock = threading.Lock()
+        self._db = self._open()
+        self.stats = {"hot_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+    def _open(self):
+        if sqlite3 is None or self.path is None: return None
+        try:
+            if not os.path.exists(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path))
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("CREATE TABLE IF NOT EXISTS responses ("
+                       "key TEXT PRIMARY KEY, body TEXT, size INTEGER, expires REAL, last_used REAL)")
+            db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            db.commit()
+            return db
+        except (sqlite3.Error, OSError):
+            return None
+
+    def is_cacheable(self, method):
+        return method in self.ttls
+
+    def get(self, method, params):
+        """ Return the cached response for method and params, or None. """
+        if not self.is_cacheable(method): return None
+        key = cache_key(method, params)
+        now = time.time()
+        with self._lock:
+            entry = self._hot.get(key)
+            if entry is not None and entry[0] > now:
+                self._hot.move_to_end(key)
+                self.stats["hot_hits"] += 1
+                return entry[1]
+
+            response = None
+            if self._db is not None:
+                try:
+                    row = self._db.execute("SELECT body, expires FROM responses WHERE key = ?", (key,)).fetchone()
+                    if row is not None and row[1] > now:
+                        response = json.loads(row[0])
+                        self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+                        self._db.commit()
+                        self._remember(key, row[1], response)
+                except (sqlite3.Error, ValueError):
+                    pass
+            self.stats["disk_hits" if response is not None else "misses"] += 1
+            return response
+
+    def put(self, method, params, response):
+        if not self.is_cacheable(method): return
+        key = cache_key(method, params)
+        now = time.time()
+        expires = now + self.ttls[method]
+        with self._lock:
+            self._remember(key, expires, response)
+            if self._db is None: return
+            body = json.dumps(response)
+            try:
+                self._db.execute("INSERT OR REPLACE INTO responses (key, body, size, expires, last_used) VALUES (?, ?, ?, ?, ?)",
+                                 (key, body, len(body), expires, now))
+                self._evict()
+                self._db.commit()
+            except sqlite3.Error:
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._hot.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def _remember(self, key, expires, response):
+        self._hot[key] = (expires, response)
+        self._hot.move_to_end(key)
+        while len(self._hot) > self.hot_entries:
+            self._hot.popitem(last=False)
+
+    def _evict(self):
+        """ Drop expired responses, then the least recently used ones until we're under max_bytes. """
+        self._db.execute("DELETE FROM responses WHERE expires <= ?", (time.time(),))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes: return
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+            if total <= self.max_bytes: break
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._hot.pop(key, None)
+            total -= size
+            self.stats["evictions"] += 1
@@ -0,0 +1,184 @@
+import heapq
+import json
+import os
+import threading
+import time
+from itertools import islice
+
+def normalize(text):
+    return " ".join((text or "").casefold().split())
+
+def trigrams(text):
+    """ The set of three character substrings of each word in text. """
+    grams = set()
+    for word in text.split():
+        for i in range(len(word) - 2):
+            grams.add(word[i:i+3])
+    return grams
+
+class SearchIndex():
+    """
+    An in-memory trigram index of the artists, albums and tracks the plugin has seen,
+    used to suggest results before Rdio has answered.
+
+    Entries are saved to path and reloaded next session. When there are more than
+    max_entries, the least used (then least recently seen) tenth is evicted, on a
+    background thread and a chunk at a time, so adding results stays cheap.
+    """
+    MAX_SCAN = 150
+    MAX_USED = 50
+    def __init__(self, path=None, max_entries=20000):
+        self.path = path
+        self.max_entries = max_entries
+
+        self._entries = {} # key -> [type, name, artist, uses, last_seen, normalized text]
+        self._postings = {} # trigram -> set of keys
+        self._used = set() # keys that have been used at least once
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._evicting = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, result):
+        """ Index an API result (a dict with at least "type", "key" and "name"). """
+        with self._lock:
+            self._add(result.get("type"), result.get("key"), result.get("name"), result.get("artist"))
+            self._evict_soon()
+
+    def add_many(self, results):
+        with self._lock:
+            for result in results:
+                self._add(result.get("type"), result.get("key"), result.get("name"), result.get("artist"))
+            self._evict_soon()
+
+    def record_use(self, key):
+        """ Rank key higher from now on, e.g. because the user picked it. """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[3] += 1
+                entry[4] = time.time()
+                self._used.add(key)
+                self._dirty = True
+
+    def uses(self, key):
+        entry = self._entries.get(key)
+        return entry[3] if entry is not None else 0
+
+    def lookup(self, query, limit=10):
+        """
+        Return up to limit results, in the same form as the API's, whose name or
+        artist contain every word of query. Prefix matches and often used results come first.
+
+        To keep lookups fast, at most MAX_SCAN candidates (plus the MAX_USED most used
+        ones) are considered, so for very common trigrams the best match may be missed.
+        """
+        query = normalize(query)
+        grams = trigrams(query)
+        if not grams: return []
+        words = query.split()
+        with self._lock:
+            # An entry whose text contains the query's words is in the postings of every
+            # one of the query's trigrams, so only the smallest postings need looking
+            # through, checking the words against the text directly.
+            smallest = min((self._postings.get(g, ()) for g in grams), key=len)
+            candidates = set(islice(smallest, self.MAX_SCAN))
+            used = self._used.intersection(smallest)
+            if len(used) > self.MAX_USED:
+                used = heapq.nlargest(self.MAX_USED, used, key=lambda key: self._entries[key][3])
+            candidates.update(used)
+
+            matches = []
+            for key in candidates:
+                entry = self._entries[key]
+                text = entry[5]
+                if all(w in text for w in words):
+                    matches.append((not text.startswith(query), -entry[3], len(text), key))
+            results = []
+            for _, _, _, key in heapq.nsmallest(limit, matches):
+                type_, name, artist = self._entries[key][:3]
+                results.append({"type": type_, "key": key, "name": name, "artist": artist})
+            return results
+
+    def _add(self, type_, key, name, artist):
+        if not key or not name or not type_: return
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry[4] = time.time()
+            if entry[1] == name and entry[2] == artist: return
+            self._remove(key)
+        self._insert(key, [type_, name, artist, entry[3] if entry else 0, time.time(), None])
+
+    def _insert(self, key, entry):
+        entry[5] = normalize(entry[1] + " " + (entry[2] or ""))
+        self._entries[key] = entry
+        if entry[3] > 0: self._used.add(key)
+        for g in trigrams(entry[5]):
+            self._postings.setdefault(g, set()).add(key)
+        self._dirty = True
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._used.discard(key)
+        for g in trigrams(entry[5]):
+            keys = self._postings.get(g)
+            if keys is not None:
+                keys.discard(key)
+                if not keys: del self._postings[g]
+
+    def _evict_soon(self):
+        """ Start evicting on a background thread if there are too many entries. Call with the lock held. """
+        if self._evicting or len(self._entries) <= self.max_entries: return
+        self._evicting = True
+        t = threading.Thread(target=self._evict)
+        t.daemon = True
+        t.start()
+
+    def _evict(self):
+        with self._lock:
+            excess = len(self._entries) - self.max_entries + self.max_entries // 10
+            entries = list(self._entries.items())
+        victims = heapq.nsmallest(excess, ((e[3], e[4], k, e) for k, e in entries))
+        # Remove in chunks so lookups made meanwhile aren't held up for the whole eviction.
+        for start in range(0, len(victims), 1000):
+            with self._lock:
+                for uses, _, key, entry in victims[start:start+1000]:
+                    # Unless it's been replaced or used since.
+                    if self._entries.get(key) is entry and entry[3] == uses:
+                        self._remove(key)
+        with self._lock:
+            self._evicting = False
+            self._evict_soon() # In case more came in meanwhile.
+
+    def load(self):
+        """ Load the entries saved by a previous session. """
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except (IOError, OSError, ValueError, TypeError):
+            return
+        # Insert in chunks so lookups made meanwhile aren't held up for the whole load.
+        for start in range(0, len(saved), 1000):
+            with self._lock:
+                for key, type_, name, artist, uses, last_seen in saved[start:start+1000]:
+                    if key not in self._entries:
+                        self._insert(key, [type_, name, artist, uses, last_seen, None])
+        with self._lock:
+            self._evict_soon()
+            self._dirty = False
+
+    def save(self):
+        """ Write the entries to path, if anything has changed. """
+        with self._lock:
+            if not self._dirty or self.path is None: return
+            saved = [[k, e[0], e[1], e[2], e[3], e[4]] for k, e in self._entries.items()]
+            self._dirty = False
+        try:
+            if not os.path.exists(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path))
+            with open(self.path, "w") as f:
+                json.dump(saved, f)
+        except (IOError, OSError):
+            pass
@@ -3,6 +3,13 @@ from __future__ import unicode_literals
 
 import sublime
 import random
+import time
+from collections import deque
+
+try:
+    from Rdio.perf import timed
+except:
+    from perf import timed
 
 sublime3 = int(sublime.version()) >= 3000
 if sublime3:
@@ -11,6 +18,18 @@ else:
     set_timeout_async = sublime.set_timeout
 
 class MusicPlayerStatusUpdater():
+    """
+    Show the current track in the status bar.
+
+    Rather than asking the player for everything on every update, the track's metadata
+    is only fetched when the track changes and the position is counted forward locally.
+    The player is asked for its state and current track every status_probe_period
+    milliseconds and the position is resynced every status_position_sync_period milliseconds.
+
+    Updates happen every status_update_period milliseconds while music is playing. While
+    paused or stopped the period doubles after each update, up to status_max_update_period,
+    and after the user does something it drops to status_min_update_period for a little while.
+    """
     def __init__(self, player):
         self.player = player
 
@@ -21,62 +40,184 @@ class MusicPlayerStatusUpdater():
         self.current_song = None
         self.current_artist = None
         self.current_album = None
-        self.current_duration = None
-
-        self._update_delay = int(s.get("status_update_period")) # Udpate every n milliseconds.
-        self._cycles_left = self.display_duration * 1000 // self._update_delay
+        self.current_duration_secs = 0
+
+        self._update_delay = int(s.get("status_update_period")) # Udpate every n milliseconds while playing.
+        self._min_update_delay = int(s.get("status_min_update_period", 100))
+        self._max_update_delay = int(s.get("status_max_update_period", 5000))
+        self._idle_update_delay = self._update_delay
+        self._fast_duration = 2.0 # Seconds to update quickly after wake().
+        self._fast_until = None
+        self._display_until = None
+        self._generation = 0 # Incremented to cancel an already scheduled update.
+
+        self._probe_period = s.get("status_probe_period", 1000) / 1000.0
+        self._position_sync_period = s.get("status_position_sync_period", 10000) / 1000.0
+
+        # What we last heard from the player.
+        self._running = False
+        self._state = ""
+        self._track_key = None
+        self._position = 0
+        self._position_time = 0 # When _position was correct.
+        self._last_probe = None
+        self._last_position_sync = None
+
+        self.stats = {"ticks": 0, "probes": 0, "metadata_fetches": 0}
+        self._tick_times = deque(maxlen=50)
+        self._probe_times = deque(maxlen=50)
+        self._current_delay = self._update_delay
 
         self.bars = ["▁","▂","▄","▅"]
 
         self._is_displaying = False
-        if self.display_duration < 0 and self.player.is_running(): self.run()
+        if self.display_duration < 0:
+            # Asking the player runs a script, so don't make whoever created us wait for it.
+            set_timeout_async(self._run_if_running, 0)
+
+    def _run_if_running(self):
+        if self.player.is_running(): self.run()
 
     def _get_min_sec_string(self,seconds):
         m = seconds//60
         s = seconds - 60*m
         return "%d:%.02d" % (m,s)
 
-    def _get_message(self):
-
-        if self.player.is_playing():
+    def _get_position(self, now):
+        """ The position of the current track, counted forward from the last time we synced it. """
+        if self._state != "playing":
+            return self._position
+        return min(self._position + now - self._position_time, self.current_duration_secs)
+
+    def _set_position(self, position, now):
+        self._position = position
+        self._position_time = now
+        self._last_position_sync = now
+
+    def _refresh(self, now):
+        """ Probe the player, fetching the track's metadata only if it has changed. """
+        self.stats["probes"] += 1
+        self._probe_times.append(now)
+        sync_position = self._last_position_sync is None or now - self._last_position_sync >= self._position_sync_period
+        probe = self.player.probe(include_position=sync_position)
+        self._last_probe = now
+        self._running = probe.running
+        if not probe.running: return
+
+        if probe.key != self._track_key:
+            self.stats["metadata_fetches"] += 1
+            self.player.invalidate_snapshot()
+            current_song_info = self.player.get_current_track()
+            self._track_key = probe.key
+            self.current_song = current_song_info.get("song","")
+            self.current_artist = current_song_info.get("artist","")
+            self.current_album = current_song_info.get("album","")
+            self.current_duration_secs = current_song_info.get("duration",0)
+            self._set_position(current_song_info.get("position",0), now)
+        elif sync_position:
+            self._set_position(probe.position, now)
+        elif probe.state != self._state:
+            # Stop (or start) counting from where we think we are.
+            self._position = self._get_position(now)
+            self._position_time = now
+        self._state = probe.state
+
+    def _get_message(self, now):
+
+        if self._state == "playing":
             icon = "►"
             random.shuffle(self.bars)
         else:
             icon = "∣∣"
 
-        current_song_info = self.player.get_current_track()
-        self.current_song = current_song_info.get("song","")
-        self.current_artist = current_song_info.get("artist","")
-        self.current_album = current_song_info.get("album","")
-        self.current_duration_secs = current_song_info.get("duration","")
-        self.current_position_secs = current_song_info.get("position","")
-
         return self.status_format.format(
             equalizer="".join(self.bars),
             icon=icon,
-            time=self._get_min_sec_string(self.current_position_secs),
+            time=self._get_min_sec_string(self._get_position(now)),
             duration=self._get_min_sec_string(self.current_duration_secs),
             song=self.current_song,
             artist=self.current_artist,
             album=self.current_album)
 
+    def _rate(self, times):
+        """ Events per second over the recent history in times. """
+        if len(times) < 2 or times[-1] == times[0]: return 0.0
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    def get_poll_stats(self):
+        """ Return the counters in stats plus the current update period and the recent update/probe rates. """
+        stats = dict(self.stats)
+        stats["update_period_ms"] = self._current_delay
+        stats["updates_per_second"] = self._rate(self._tick_times)
+        stats["probes_per_second"] = self._rate(self._probe_times)
+        return stats
+
+    def _get_next_delay(self, now, playing):
+        if self._fast_until is not None and now < self._fast_until:
+            return self._min_update_delay
+        if playing:
+            self._idle_update_delay = self._update_delay
+        else:
+            self._idle_update_delay = min(self._idle_update_delay * 2, self._max_update_delay)
+        return self._idle_update_delay
+
+    def _schedule(self, delay):
+        self._current_delay = delay
+        generation = self._generation
+        set_timeout_async(lambda: self._run(generation), delay)
+
+    def wake(self):
+        """ Update quickly for a little while, e.g. because the user just changed the track. """
+        self._fast_until = time.monotonic() + self._fast_duration
+        self._idle_update_delay = self._update_delay
+        self._last_probe = None
+        if self._is_displaying:
+            # Replace the scheduled update, which may be a while away.
+            self._generation += 1
+            self._schedule(self._min_update_delay)
+
     def run(self):
+        # Something probably just changed, so don't wait for the next probe.
+        self._last_probe = None
         if not self._is_displaying:
             self._is_displaying = True
-            self._run()
+            if self.display_duration > 0:
+                self._display_until = time.monotonic() + self.display_duration
+            self._generation += 1
+            self._run(self._generation)
 
-    def _run(self):
-        if self._cycles_left == 0:
-            sublime.status_message("")
-            self._cycles_left = self.display_duration * 1000 / self._update_delay
-            self._is_displaying = False
+    def _stop(self):
+        sublime.status_message("")
+        self._is_displaying = False
+        self._display_until = None
+
+    @timed("MusicPlayerStatusUpdater._run")
+    def _run(self, generation):
+        if generation != self._generation: return
+        now = time.monotonic()
+        if self.display_duration == 0 or (self._display_until is not None and now >= self._display_until):
+            self._stop()
+            return
+
+        self.stats["ticks"] += 1
+        self._tick_times.append(now)
+        fast = self._fast_until is not None and now < self._fast_until
+        probe_period = self._min_update_delay / 1000.0 if fast else self._probe_period
+        if self._last_probe is None or now - self._last_probe >= probe_period:
+            self._refresh(now)
+
+        if not self._running:
+            self._stop()
             return
-        elif self._cycles_left > 0:
-            self._cycles_left -= 1
 
-        if self.player.is_running() and not self.player.is_stopped():
-            sublime.status_message(self._get_message())
-            set_timeout_async(lambda: self._run(), self._update_delay)
+        # The player doesn't report "stopped", there's just no current track.
+        stopped = self.current_artist == ""
+        if not stopped:
+            sublime.status_message(self._get_message(now))
+        elif self.display_duration > 0:
+            self._stop()
+            return
         else:
+            # Keep an eye out for music starting, but not very often.
             sublime.status_message("")
-            self._is_displaying = False
+        self._schedule(self._get_next_delay(now, self._state == "playing" and not stopped))
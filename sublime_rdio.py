@@ -1,20 +1,30 @@
+import time
+_import_started = time.perf_counter()
+
 import sublime, sublime_plugin
 from queue import Queue, Empty
 import threading
 import json
-import time
-from datetime import datetime
-import random
-from urllib.error import HTTPError
 
 import sys
+import os
 
-from Rdio.rdio import Rdio
+# The network and player modules are imported the first time they're needed
+# (see rdio_client() and rdio_player()), which keeps loading the plugin quick.
+from Rdio import perf
+from Rdio.credentials import CredentialValidator, is_auth_failure
+from Rdio.suggestion_cache import SuggestionCache
+from Rdio.search_index import SearchIndex
+from Rdio.suggestion_builder import build_suggestions
 
 ARTIST_TYPE = "artist"
 ALBUM_TYPE = "album"
 TRACK_TYPE = "track"
 
+MIN_QUERY_LENGTH = 2
+RESULTS_PAGE_SIZE = 25
+LOAD_MORE_ROW = u"Load more\u2026"
+
 RDIO_ARTIST_TYPE = 'r'
 RDIO_ALBUM_TYPE = 'a'
 RDIO_TRACK_TYPE = 't'
@@ -22,42 +32,175 @@ RDIO_TRACK_TYPE = 't'
 RDIO_API_KEY = None
 RDIO_API_SECRET = None
 VALID_API_CREDENTIALS = False
-
-try: # ST2
-    from urllib.request import urlopen
-    from urllib.parse import quote_plus
-except: # ST3
-    from urllib2 import urlopen
-    from urllib import quote_plus
+INVALID_CREDENTIALS_MESSAGE = ("Sorry, search requires a valid API key and secret to work. " +
+    "See the Rdio package settings (Preferences -> Package Settings -> Rdio) for more information.")
+CREDENTIALS = None
+RESPONSE_CACHE = None
+RESPONSE_CACHE_OPTIONS = None # (path, max_bytes) for rdio_client() to open it with, if enabled
+SUGGESTION_CACHE = SuggestionCache() # Shared by every window.
+SEARCH_INDEX = SearchIndex() # Everything we've seen, for suggestions without the network.
 
 sublime3 = int(sublime.version()) >= 3000
-if sublime3:
-    from Rdio.applescript_rdio_player import AppleScriptRdioPlayer as RdioPlayer
-    from Rdio.status_updater import MusicPlayerStatusUpdater
-else:
-    from rdio_player import RdioPlayer
-    from status_updater import MusicPlayerStatusUpdater
 
 def plugin_loaded():
-    global RDIO_API_KEY, RDIO_API_SECRET, VALID_API_CREDENTIALS
+    global RDIO_API_KEY, RDIO_API_SECRET, VALID_API_CREDENTIALS, CREDENTIALS, RESPONSE_CACHE_OPTIONS
 
+    start = time.perf_counter()
     s = sublime.load_settings("Rdio.sublime-settings")
+    perf.enabled = s.get("enable_perf_stats", False)
     RDIO_API_KEY = s.get("rdio_api_key")
     RDIO_API_SECRET = s.get("rdio_api_secret")
 
-    # Test to see if the credentials are valid.
-    try:
-        response = Rdio((RDIO_API_KEY, RDIO_API_SECRET)).call("get", {"keys":""})
-        VALID_API_CREDENTIALS = True
-    except HTTPError:
-        VALID_API_CREDENTIALS = False
+    # Use what we knew about the credentials last time and check them
+    # in the background, rather than holding up start up on the network.
+    CREDENTIALS = CredentialValidator(RDIO_API_KEY, RDIO_API_SECRET,
+        os.path.join(sublime.cache_path(), "Rdio", "credentials.json"))
+    VALID_API_CREDENTIALS = CREDENTIALS.is_valid()
+    validate_credentials()
+
+    if s.get("enable_response_cache", True):
+        RESPONSE_CACHE_OPTIONS = (os.path.join(sublime.cache_path(), "Rdio", "responses.sqlite"),
+            s.get("response_cache_size", 20) * 1024 * 1024)
+    else:
+        RESPONSE_CACHE_OPTIONS = None
+
+    SEARCH_INDEX.path = os.path.join(sublime.cache_path(), "Rdio", "search_index.json")
+    SEARCH_INDEX.max_entries = s.get("search_index_size", 20000)
+    threading.Thread(target=SEARCH_INDEX.load).start()
+
+    # Show the status as soon as the player has been asked about, without waiting for it here.
+    if s.get("status_duration", -1) < 0 and sys.platform == "darwin":
+        sublime.set_timeout_async(rdio_player, 0)
+    perf.record("plugin_loaded", time.perf_counter() - start)
+
+def plugin_unloaded():
+    SEARCH_INDEX.save()
+
+def save_search_index():
+    threading.Thread(target=SEARCH_INDEX.save).start()
+
+def validate_credentials():
+    """ Re-check the API credentials in the background if the last check is out of date or rejected them. """
+    if CREDENTIALS.needs_validation():
+        CREDENTIALS.validate_async(set_credentials_valid)
+
+_client = None
+_client_consumer = None
+_key_loader = None
+_prefetcher = None
+def rdio_client():
+    """ The AsyncRdio client shared by every command, for the current API credentials. """
+    global _client, _client_consumer, _key_loader, _prefetcher, RESPONSE_CACHE
+    if _client is None or _client_consumer != (RDIO_API_KEY, RDIO_API_SECRET):
+        from Rdio.rdio import AsyncRdio
+        from Rdio.key_loader import KeyLoader
+        from Rdio.prefetcher import Prefetcher
+        if RESPONSE_CACHE is None and RESPONSE_CACHE_OPTIONS is not None:
+            from Rdio.response_cache import ResponseCache
+            path, max_bytes = RESPONSE_CACHE_OPTIONS
+            RESPONSE_CACHE = ResponseCache(path, max_bytes=max_bytes)
+        _client_consumer = (RDIO_API_KEY, RDIO_API_SECRET)
+        _client = AsyncRdio(_client_consumer, cache=RESPONSE_CACHE)
+        _key_loader = KeyLoader(_client)
+        _prefetcher = Prefetcher(_client)
+    return _client
+
+def key_loader():
+    """ The KeyLoader that batches lookups by key on rdio_client(). """
+    rdio_client()
+    return _key_loader
+
+def prefetcher():
+    """ The Prefetcher that fetches what's likely to be picked next with rdio_client(). """
+    rdio_client()
+    return _prefetcher
+
+def cancellation_token():
+    """ A new CancellationToken, for calls on rdio_client(). """
+    from Rdio.rdio import CancellationToken
+    return CancellationToken()
+
+# Calls whose results are fetched RESULTS_PAGE_SIZE at a time.
+PAGED_METHODS = ("search", "getTracksForArtist", "getAlbumsForArtist")
+
+def page_params(method, params, start):
+    """ params for the page of method's results from start on. """
+    if method not in PAGED_METHODS: return params
+    return dict(params, start=str(start), count=str(RESULTS_PAGE_SIZE))
+
+# The calls made to show what's under an artist or album.
+def artist_tracks_call(key):
+    return ("getTracksForArtist", page_params("getTracksForArtist", {"artist":key}, 0))
+
+def artist_albums_call(key):
+    return ("getAlbumsForArtist", page_params("getAlbumsForArtist", {"artist":key}, 0))
+
+def album_tracks_call(key):
+    # Same as the call key_loader() makes for a single album with tracks.
+    return ("get", {"keys":key, "extras":"tracks"})
+
+def next_step_calls(key):
+    """ The calls that picking key (a suggestion or search result) could lead to. """
+    if key.startswith(RDIO_ALBUM_TYPE):
+        return [album_tracks_call(key)]
+    if key.startswith(RDIO_ARTIST_TYPE):
+        return [artist_tracks_call(key), artist_albums_call(key)]
+    return []
+
+def set_credentials_valid(valid):
+    global VALID_API_CREDENTIALS
+    VALID_API_CREDENTIALS = valid
+
+class LatestValueMailbox():
+    """ A single slot for passing values between threads. Putting a new value replaces the old one. """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value = None
+        self._full = False
+
+    def put(self, value):
+        with self._lock:
+            self._value = value
+            self._full = True
+
+    def take(self):
+        """ Return (True, value) and empty the slot, or (False, None) if it's already empty. """
+        with self._lock:
+            if not self._full: return (False, None)
+            value, self._value, self._full = self._value, None, False
+            return (True, value)
+
+_player = None
+_player_lock = threading.Lock()
+def rdio_player():
+    """
+    The player shared by every command, with its status updater. It's created the first
+    time a command needs it (Sublime makes the commands for every window at start up).
+    """
+    global _player
+    with _player_lock:
+        if _player is None:
+            start = time.perf_counter()
+            if sublime3:
+                from Rdio.applescript_rdio_player import AppleScriptRdioPlayer as RdioPlayer
+                from Rdio.status_updater import MusicPlayerStatusUpdater
+            else:
+                from rdio_player import RdioPlayer
+                from status_updater import MusicPlayerStatusUpdater
+            player = RdioPlayer.Instance()
+            if not player.status_updater:
+                player.status_updater = MusicPlayerStatusUpdater(player)
+            _player = player
+            perf.record("rdio_player", time.perf_counter() - start)
+    return _player
 
 class RdioCommand(sublime_plugin.WindowCommand):
     def __init__(self, window):
         self.window = window
-        self.player = RdioPlayer.Instance()
-        if not self.player.status_updater:
-            self.player.status_updater = MusicPlayerStatusUpdater(self.player)
+
+    @property
+    def player(self):
+        return rdio_player()
 
 class RdioPlayCommand(RdioCommand):
     def run(self):
@@ -83,6 +226,56 @@ class RdioNowPlaying(RdioCommand):
     def run(self):
         self.player.show_status_message()
 
+def perf_counters():
+    """ The counters kept by the caches, connection machinery and player, for the performance stats. """
+    from Rdio.rdio import connection_pool, singleflight
+    counters = {
+        "connection_pool": connection_pool.stats,
+        "singleflight": singleflight.stats,
+        "suggestion_cache": SUGGESTION_CACHE.stats,
+    }
+    if RESPONSE_CACHE is not None:
+        counters["response_cache"] = RESPONSE_CACHE.stats
+    if _client is not None:
+        counters["key_loader"] = _key_loader.stats
+        counters["prefetcher"] = _prefetcher.stats
+    if _player is not None:
+        counters["player"] = _player.stats
+        if _player.status_updater:
+            counters["status_updater"] = _player.status_updater.get_poll_stats()
+    return counters
+
+class RdioPerformanceStatsCommand(sublime_plugin.WindowCommand):
+    """ Show where the plugin has been spending its time in a scratch view, and save it as JSON. """
+    def run(self):
+        path = os.path.join(sublime.cache_path(), "Rdio", "perf_stats.json")
+        counters = perf_counters()
+        try:
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            perf.export(path, counters)
+            saved = "Saved as JSON to %s" % path
+        except (IOError, OSError) as e:
+            saved = "Couldn't save as JSON: %s" % e
+
+        text = perf.report() + "\n\n"
+        if not perf.enabled:
+            text += "Timing is off, so only start up is shown. Set \"enable_perf_stats\" to true to turn it on.\n\n"
+        for name, values in sorted(counters.items()):
+            text += "%s: %s\n" % (name, json.dumps(values, sort_keys=True))
+        text += "\n" + saved + "\n"
+
+        view = self.window.new_file()
+        view.set_name("Rdio Performance Stats")
+        view.set_scratch(True)
+        view.run_command("append", {"characters": text})
+        view.set_read_only(True)
+
+class RdioReplaceRegionCommand(sublime_plugin.TextCommand):
+    """ Replace the text between begin and end with text. Used to update the search panel in place. """
+    def run(self, edit, begin, end, text):
+        self.view.replace(edit, sublime.Region(begin, end), text)
+
 class RdioSearchCommand(RdioCommand):
     """
     Handle all of the mechanics around searching.
@@ -93,19 +286,26 @@ class RdioSearchCommand(RdioCommand):
         RdioCommand.__init__(self,window)
 
         self.just_opened = True
+        self.searching = False
         self.typed = ""
         self.last_content = ""
 
         self.suggestion_selector = "→"
         self.selected_suggestion_index = None
 
-        self.input_view_width = 0
+        self.input_view = None
+        self.panel_text = "" # what's in input_view, as of the last on_change
+        self.input_view_length = 0
+        self.viewport_extent = None # when input_view_length was worked out
 
-        # Two way producer / consumer
+        # Queries go to the suggestion thread through query_q, and only the
+        # latest suggestions come back through suggestion_mailbox.
         self.last_sent_query = ""
         self.query_q = Queue()
-        self.suggestion_q = Queue()
+        self.suggestion_mailbox = LatestValueMailbox()
         self.suggestions = []
+        self.suggestion_token = None # CancellationToken, from run() on
+        self.search_token = None # CancellationToken, from the first search on
         self.END_OF_SUGGESTIONS = ''
         self.STOP_THREAD_MESSAGE = 'END_OF_THREAD_TIME' # passed as a query to stop the thread
 
@@ -114,14 +314,18 @@ class RdioSearchCommand(RdioCommand):
 
         rdio_settings = sublime.load_settings("Rdio.sublime-settings")
         self.enable_search_suggestions = rdio_settings.get("enable_search_suggestions")
+        self.suggestion_debounce = rdio_settings.get("search_suggestion_debounce", 150) / 1000.0
+        self.prefetch_count = rdio_settings.get("prefetch_suggestions", 3)
 
     def run(self):
+        validate_credentials()
         if not VALID_API_CREDENTIALS:
-            sublime.error_message(
-                "Sorry, search requires a valid API key and secret to work. " +
-                "See the Rdio package settings (Preferences -> Package Settings -> Rdio) for more information.")
+            sublime.error_message(INVALID_CREDENTIALS_MESSAGE)
             return
 
+        if self.suggestion_token is None:
+            self.suggestion_token = cancellation_token()
+
         # Disable tab complete so that we can tab through suggestions.
         if self.user_tab_complete_value == False:
             settings = sublime.load_settings("Preferences.sublime-settings")
@@ -129,6 +333,7 @@ class RdioSearchCommand(RdioCommand):
             sublime.save_settings("Preferences.sublime-settings")
 
         self.typed = ""
+        self.searching = True
         self.open_search_panel("")
 
         # Start search suggestion thread.
@@ -154,7 +359,44 @@ class RdioSearchCommand(RdioCommand):
         v.sel().add(sublime.Region(pt))
         v.show(pt)
 
-        self.input_view_length = v.viewport_extent()[0]//v.em_width() - 1
+        self.input_view = v
+        self.panel_text = content
+        self.viewport_extent = None
+        self.update_layout()
+
+    def update_layout(self):
+        """ Work out how many characters fit in the search panel, if its size has changed. """
+        extent = self.input_view.viewport_extent()
+        if extent != self.viewport_extent:
+            self.viewport_extent = extent
+            self.input_view_length = extent[0]//self.input_view.em_width() - 1
+
+    def render_search_panel(self, content):
+        """
+        Show content in the open search panel, with the cursor at the end of the typed query.
+        Only the part of the panel's text that differs from content is replaced, and
+        nothing is done if it's the same.
+        """
+        v = self.input_view
+        if v is None or not v.is_valid():
+            self.open_search_panel(content)
+            return
+
+        self.last_content = content # so on_change ignores our own edit
+        current = self.panel_text
+        if current != content:
+            start = len(os.path.commonprefix([current, content]))
+            end = len(os.path.commonprefix([current[start:][::-1], content[start:][::-1]]))
+            self.panel_text = content
+            v.run_command("rdio_replace_region", {"begin": start, "end": len(current) - end, "text": content[start:len(content) - end]})
+
+        pt = len(self.typed) # The panel is a single line.
+        sel = v.sel()
+        if len(sel) != 1 or sel[0].a != pt or sel[0].b != pt:
+            sel.clear()
+            sel.add(sublime.Region(pt))
+            v.show(pt)
+        self.update_layout()
 
     def on_change(self, content):
         """
@@ -164,23 +406,26 @@ class RdioSearchCommand(RdioCommand):
         highlight the next suggestion (if there are any suggestions).
         Also, submit the current search query to the query_q Queue for
         processing by the suggestion thread. Finally, display the most
-        recent search suggestion list as retrieved from the suggestion_q Queue.
+        recent search suggestion list. Newer suggestions are displayed
+        by show_new_suggestions as soon as they arrive.
         """
+        self.panel_text = content
         # If search suggestions are disabled, we just take text input and wait for a "done" or "cancel" event.
         if not self.enable_search_suggestions:
             self.typed = content
             return
 
-        MIN_QUERY_LENGTH = 2
         tabbed = False
         if self.just_opened:
             self.just_opened = False
             return
+        if content == self.last_content: # The panel being updated by render_search_panel.
+            return
 
         # allows ctrl-a + delete
         if len(content) == 0:
             self.typed = ""
-            self.open_search_panel("")
+            self.render_search_panel("")
             return
 
         new_c = content.split(" (Suggestions")[0][-1]
@@ -196,15 +441,28 @@ class RdioSearchCommand(RdioCommand):
         if len(self.typed) > MIN_QUERY_LENGTH:
             self.last_sent_query = self.typed
             self.query_q.put(self.typed) # send query to every two character differences
-
-        # Fetch the latest suggestions.
-        try:
-            while True:
-                self.suggestions = self.suggestion_q.get_nowait()
-                time.sleep(0.1)
-        except Empty:
-            pass
-
+            if not tabbed: # Show what we already know until Rdio answers.
+                self.suggestions = self.get_suggestions(SEARCH_INDEX.lookup(self.typed), self.typed)
+
+        self.display_suggestions(tabbed)
+
+    def show_new_suggestions(self):
+        """ Display suggestions that just arrived from the suggestion thread. Runs on the main thread. """
+        has_suggestions, value = self.suggestion_mailbox.take()
+        if not has_suggestions or not self.searching: return
+        query, suggestions = value
+        if query != self.last_sent_query: return # Superseded.
+        self.suggestions = suggestions
+        self.display_suggestions(False)
+        self.prefetch(key for _, key in suggestions[:self.prefetch_count])
+
+    def prefetch(self, keys):
+        """ Fetch what picking each of keys would show, so it's there straight away. """
+        if self.prefetch_count > 0:
+            prefetcher().prefetch([call for key in keys for call in next_step_calls(key)])
+
+    def display_suggestions(self, tabbed):
+        """ Show the typed query and the current suggestions in the search panel. """
         # Try to prevent unhelpful suggestions.
         if len(self.typed) < MIN_QUERY_LENGTH:
             self.suggestions = []
@@ -233,11 +491,18 @@ class RdioSearchCommand(RdioCommand):
         if len(comma_separated_suggestions) > 0:
             suggestion_string = " (Suggestions[TAB to select]: {})".format(comma_separated_suggestions, self.END_OF_SUGGESTIONS)
 
-        self.open_search_panel("{}{}{}".format(self.typed, suggestion_string, self.END_OF_SUGGESTIONS))
+        self.render_search_panel("{}{}{}".format(self.typed, suggestion_string, self.END_OF_SUGGESTIONS))
 
     def on_done(self, final_query):
+        self.searching = False
+        self.input_view = None
         self.query_q.put(self.STOP_THREAD_MESSAGE) # tell the thread to stop
         query, key = self.parse_selected_suggestion(final_query)
+        if key is not None:
+            SEARCH_INDEX.record_use(key)
+        # Only what was picked is still worth prefetching.
+        self.prefetch([key] if key else [])
+        save_search_index()
         if key == None:
             self.search('search', {'query':query, 'types':'Artist, Album, Track'})
         elif key.startswith(RDIO_ARTIST_TYPE):
@@ -250,7 +515,11 @@ class RdioSearchCommand(RdioCommand):
         self.restore_tab_setting()
 
     def on_cancel(self):
+        self.searching = False
+        self.input_view = None
         self.query_q.put(self.STOP_THREAD_MESSAGE) # tell the thread to stop
+        prefetcher().cancel()
+        save_search_index()
         self.restore_tab_setting()
 
     def restore_tab_setting(self):
@@ -275,70 +544,68 @@ class RdioSearchCommand(RdioCommand):
             key = self.suggestions[self.selected_suggestion_index][1]
         return (query, key)
 
-    def get_suggestions(self, rdio_results):
+    @perf.timed("RdioSearchCommand.get_suggestions")
+    def get_suggestions(self, results, query):
+        """ The (name, key) pairs from results to show for query, best first, that fit in the search panel. """
         MAX_TEXT_LENGTH = self.input_view_length - len(self.typed) - len(" (Suggestions[TAB to select]: )") - 2
-        suggestions = []
-        for res in rdio_results['result']:
-            if res['type'] == RDIO_ARTIST_TYPE:
-                artist = res.get("name", None)
-                key = res.get("key", None)
-                t = (artist,key)
-                if artist and t not in suggestions:
-                    suggestions.append(t)
-            elif res['type'] == RDIO_ALBUM_TYPE:
-                album = res.get("name", None)
-                key = res.get("key", None)
-                t = (album,key)
-                if album and t not in suggestions:
-                    suggestions.append(t)
-            elif res['type'] == RDIO_TRACK_TYPE:
-                track = res.get("name", None)
-                key = res.get("key", None)
-                t = (track,key)
-                if track and t not in suggestions:
-                    suggestions.append(t)
-            else:
-                continue #ignore other types of results
-            s_list = list(zip(*suggestions))[0]
-            if len(", ".join(s_list)) > MAX_TEXT_LENGTH:
-                suggestions.pop()
-                break
-        return suggestions
+        return build_suggestions(results, query, MAX_TEXT_LENGTH, SEARCH_INDEX.uses)
 
     def run_search_suggestion_helper(self):
         """
         Reads from the self.query_q Queue and searches the Rdio suggestions API.
-        Places the results in the self.suggestions_q Queue in the form of: [("{suggestion}", "{Rdio Key}")]
+        Only a query that isn't followed by another within the debounce window is looked up,
+        and looking it up cancels the previous lookup if it hasn't finished.
+        Results are passed to deliver_suggestions.
         """
-        rdio = Rdio((RDIO_API_KEY, RDIO_API_SECRET))
-
-        new_query = ""
         last_query = None
         while True:
-            try:
-                while True: #Empty the queue.
-                    new_query = self.query_q.get_nowait()
-                    time.sleep(0.1) # very important, else these while True loops hog the cpu.
-            except Empty:
-                pass
-
-            if new_query == self.STOP_THREAD_MESSAGE: break
+            new_query = self.query_q.get()
+            # Wait for typing to pause, skipping the queries that are superseded in the meantime.
+            while new_query != self.STOP_THREAD_MESSAGE:
+                try:
+                    new_query = self.query_q.get(timeout=self.suggestion_debounce)
+                except Empty:
+                    break
+
+            if new_query == self.STOP_THREAD_MESSAGE:
+                self.suggestion_token.cancel()
+                break
 
             if new_query != last_query:
                 last_query = new_query
-                response = rdio.call('searchSuggestions', {'query':new_query})
-                suggestions = self.get_suggestions(response)
-                self.suggestion_q.put(suggestions)
-            time.sleep(0.1)
+                results = SUGGESTION_CACHE.get(new_query)
+                if results is not None:
+                    self.deliver_suggestions(new_query, results)
+                    continue
+                self.suggestion_token.cancel()
+                self.suggestion_token = cancellation_token()
+                future = rdio_client().call_async('searchSuggestions', {'query':new_query}, self.suggestion_token)
+                future.add_done_callback(lambda f, q=new_query: self.handle_suggestion_response(q, f))
+
+    def handle_suggestion_response(self, query, future):
+        if future.cancelled() or future.exception() is not None: return
+        results = future.result()['result']
+        SUGGESTION_CACHE.put(query, results)
+        SEARCH_INDEX.add_many(results)
+        self.deliver_suggestions(query, results)
+
+    def deliver_suggestions(self, query, results):
+        """
+        Places the suggestions in self.suggestion_mailbox in the form of: (query, [("{suggestion}", "{Rdio Key}")])
+        and has the main thread display them. Local results Rdio didn't return are ranked in with its own.
+        """
+        results = results + SEARCH_INDEX.lookup(query)
+        self.suggestion_mailbox.put((query, self.get_suggestions(results, query)))
+        sublime.set_timeout(self.show_new_suggestions, 0)
 
     def display_artist_options(self, query, key):
         self.window.show_quick_panel(["Songs by " + query, "Albums by " + query], lambda idx: self.handle_artist_selection(idx, key))
 
     def handle_artist_selection(self, index, key):
         if index == 0:
-            self.search("getTracksForArtist", {"artist":key, "count":"50"})
+            self.search(*artist_tracks_call(key))
         if index == 1:
-            self.search("getAlbumsForArtist", {"artist":key, "count":"20"})
+            self.search(*artist_albums_call(key))
 
     def display_album_options(self, query, key):
         self.window.show_quick_panel(["Play " + query, "Show tracks on " + query], lambda idx: self.handle_album_selection(idx, key, query))
@@ -347,67 +614,137 @@ class RdioSearchCommand(RdioCommand):
         if index == 0:
             self.player.play_album(key, album_name)
         if index == 1:
-            track_thread = ThreadedRdioTrackRequest(key, self)
-            track_thread.setDaemon(True)
-            track_thread.start()
-
-    def search(self, query, params):
-        url_thread = ThreadedRdioSearchRequest(query, params, self)
-        url_thread.setDaemon(True)
-        url_thread.start()
-
+            token = self.start_results(*album_tracks_call(key))
+            prefetched = prefetcher().get(*album_tracks_call(key))
+            if prefetched is not None:
+                tracks = get_album_tracks(prefetched["result"].get(key))
+                sublime.set_timeout(lambda: self.handle_search_response("getTracksForAlbum", tracks, None), 10)
+                return
+            # The album comes with its tracks embedded, so this takes one round trip.
+            future = key_loader().load(key, extras="tracks", token=token)
+            future.add_done_callback(lambda f: self.deliver_search_response("getTracksForAlbum", f))
+
+    def search(self, method, params):
+        """ Show the first page of results for a call. Later pages are fetched in the background. """
+        params = page_params(method, params, 0)
+        token = self.start_results(method, params)
+        prefetched = prefetcher().get(method, params)
+        if prefetched is not None:
+            sublime.set_timeout(lambda: self.handle_search_response(method, prefetched, None), 10)
+            return
+        future = rdio_client().call_async(method, params, token)
+        future.add_done_callback(lambda f: self.deliver_search_response(method, f))
+
+    def start_results(self, method, params):
+        """ Forget the results shown, cancel any search in progress and return a token for the call that replaces them. """
+        self.page_call = (method, params)
+        self.loaded = 0 # results received so far, including ones we don't show
+        self.more_results = False
+        self.next_page = None
+        self.rows = []
+        self.rdio_keys = []
+        self.result_names = [] # for use in further dialogs
+        return self.new_search_token()
+
+    def fetch_next_page(self):
+        """ Start fetching the page after the ones loaded, to have it ready for "Load more". """
+        method, params = self.page_call
+        self.next_page = rdio_client().call_async(method, page_params(method, params, self.loaded), self.search_token)
+
+    def new_search_token(self):
+        """ Cancel the search in progress, if any, and return a token for a new one. """
+        if self.search_token is not None:
+            self.search_token.cancel()
+        self.search_token = cancellation_token()
+        return self.search_token
+
+    def deliver_search_response(self, method, future):
+        """ Pass a finished search to handle_search_response on the main thread, unless it was superseded. """
+        from concurrent.futures import CancelledError
+        if future.cancelled(): return
+        error = future.exception()
+        # A search cancelled once it was running ends with CancelledError (from token.check()) instead.
+        if isinstance(error, CancelledError): return
+        response = None if error else future.result()
+        if error is None and method == "getTracksForAlbum":
+            response = get_album_tracks(response)
+        elif error is None and response['status'] != 'ok':
+            error = "Rdio internal server error."
+        sublime.set_timeout(lambda: self.handle_search_response(method, response, error), 10)
+
+    @perf.timed("RdioSearchCommand.handle_search_response")
     def handle_search_response(self, method, response, error_message):
-        """ Parse the various types of searches and display the results in the quick panel. """
-
-        MAX_RESULTS = 50
+        """
+        Parse a page of the various types of searches, add it to the results in the
+        quick panel and show them, with a "Load more" row if there are more pages.
+        """
+        if is_auth_failure(error_message):
+            CREDENTIALS.record(False)
+            set_credentials_valid(False)
+            sublime.error_message(INVALID_CREDENTIALS_MESSAGE)
+            return
         if error_message is not None:
             sublime.error_message("Unable to search:\n%s" % error_message)
             return
 
-        if (method == "search" and response["result"]["number_results"] == 0) or \
-           (method == "getTracksForArtist" and len(response["result"]) == 0)  or \
-           (method == "getAlbumsForArtist" and len(response["result"]) == 0)  or \
-           (method == "getTracksForAlbum" and len(response) == 0):
-            self.open_search_panel("No results found, try again?")
-            return
-
+        total = None
         if method == "search":
             results = response["result"]["results"]
+            total = response["result"]["number_results"]
         elif method == "getTracksForArtist" or method == "getAlbumsForArtist":
             results = response["result"]
         elif method == "getTracksForAlbum":
             results = response
+        SEARCH_INDEX.add_many(results)
 
-        rows = []
-        self.rdio_keys = []
-        self.result_names = [] # for use in further dialogs
+        if self.loaded == 0 and len(results) == 0:
+            self.open_search_panel("No results found, try again?")
+            return
+
+        first_new_row = len(self.rows)
+        self.loaded += len(results)
+        if method not in PAGED_METHODS:
+            self.more_results = False
+        elif total is not None:
+            self.more_results = self.loaded < total
+        else:
+            self.more_results = len(results) == RESULTS_PAGE_SIZE
 
         for r in results:
             if r['type'] == RDIO_TRACK_TYPE:
                 song = r.get("name","")
                 artists = r.get("artist","")
                 album = r.get("album", "")
-                rows.append([u"{0} by {1}".format(song, artists), u"{0}".format(album)])
+                self.rows.append([u"{0} by {1}".format(song, artists), u"{0}".format(album)])
                 self.result_names.append(song)
                 self.rdio_keys.append(r.get("key", ""))
             elif r['type'] == RDIO_ALBUM_TYPE:
                 name = r.get("name","")
                 artists = r.get("artist", "")
                 num_tracks = r.get("length", "")
-                rows.append([u"{0} [Album]".format(name), u"by {0}".format(artists)])
+                self.rows.append([u"{0} [Album]".format(name), u"by {0}".format(artists)])
                 self.result_names.append(name)
                 self.rdio_keys.append(r.get("key", ""))
             elif r['type'] == RDIO_ARTIST_TYPE:
                 name = r.get("name", "")
-                rows.append([u"{0} [Artist]".format(name),""])
+                self.rows.append([u"{0} [Artist]".format(name),""])
                 self.result_names.append(name)
                 self.rdio_keys.append(r.get("key", ""))
-            if len(rows) > MAX_RESULTS: break
-        self.window.show_quick_panel(rows, self.handle_search_quick_panel_selection)
+
+        rows = self.rows
+        if self.more_results:
+            rows = rows + [[LOAD_MORE_ROW, "" if total is None else "{0} more".format(total - self.loaded)]]
+            self.fetch_next_page()
+        self.window.show_quick_panel(rows, self.handle_search_quick_panel_selection, 0, min(first_new_row, len(rows) - 1))
 
     def handle_search_quick_panel_selection(self, index):
         if index == -1: return # dialog was cancelled
+        if index == len(self.rdio_keys): # Load more
+            method = self.page_call[0]
+            self.next_page.add_done_callback(lambda f: self.deliver_search_response(method, f))
+            return
         key = self.rdio_keys[index]
+        SEARCH_INDEX.record_use(key)
         if key.startswith(RDIO_ALBUM_TYPE):
             sublime.set_timeout(lambda: self.display_album_options(self.result_names[index], key), 10)
         elif key.startswith(RDIO_ARTIST_TYPE):
@@ -415,51 +752,8 @@ class RdioSearchCommand(RdioCommand):
         else:
             self.player.play_track(key)
 
-class ThreadedRdioSearchRequest(threading.Thread):
-    """ Given a Rdio API method and parameters, return the response via a callback. """
-
-    def __init__(self, method, params, caller):
-        threading.Thread.__init__(self)
-        self.method = method
-        self.params = params
-        self.caller = caller
-        self.rdio = Rdio((RDIO_API_KEY, RDIO_API_SECRET))
-
-    def run(self):
-        error = None
-        try:
-            response = self.rdio.call(self.method, self.params)
-            if response['status'] != 'ok': error = "Rdio internal server error."
-        except e:
-            response = None
-            error = e
-
-        # Start playing on the main thread.
-        sublime.set_timeout(lambda: self.caller.handle_search_response(self.method, response, error), 10)
-
-class ThreadedRdioTrackRequest(threading.Thread):
-    """ Given a Rdio album key (e.g. "a123123") and a caller, returns a list of track information via a callback. """
-
-    def __init__(self, album_key, caller):
-        threading.Thread.__init__(self)
-        self.album_key = album_key
-        self.caller = caller
-        self.rdio = Rdio((RDIO_API_KEY, RDIO_API_SECRET))
-
-    def run(self):
-        error = None
-        try:
-            album_response = self.rdio.call("get", {"keys":self.album_key})
-            track_keys = album_response["result"][self.album_key]["trackKeys"]
-            track_response = self.rdio.call("get", {"keys":", ".join(track_keys)})
-            response = []
-            for k in track_keys:
-                response.append(track_response["result"][k])
-        except e:
-            response = None
-            error = e
-
-        # Start playing on the main thread.
-        sublime.set_timeout(lambda: self.caller.handle_search_response("getTracksForAlbum", response, error), 10)
-
+def get_album_tracks(album):
+    """ Given an album fetched with the "tracks" extra (or None), returns a list of track information. """
+    return (album or {}).get("tracks", [])
 
+perf.record("import sublime_rdio", time.perf_counter() - _import_started)
@@ -0,0 +1,57 @@
+import heapq
+
+from Rdio.suggestion_cache import normalize_query
+
+SEPARATOR = ", "
+
+# Artists before albums before tracks, other things Rdio suggests aren't shown.
+TYPE_PRIORITY = {"r": 0, "a": 1, "t": 2}
+
+# Only this many results are ranked. The API already puts the most relevant first,
+# and this runs on the UI thread on every keystroke, so its cost has to stay bounded
+# however many results there are.
+MAX_RANKED = 50
+
+def match_rank(name, query):
+    """ 0 if name is query, 1 if it starts with it, 2 if a word in it does, 3 otherwise. """
+    name = name.casefold()
+    if name == query: return 0
+    if name.startswith(query): return 1
+    if (" " + query) in name: return 2
+    return 3
+
+def build_suggestions(results, query, max_width, uses=None):
+    """
+    Return [(name, key)] for the best of results that fit in max_width characters once joined with SEPARATOR.
+
+    Results are ranked by how well their name matches query, then artists before albums before
+    tracks, then by how often they've been used (uses(key), e.g. SearchIndex.uses), then by their
+    original order. Results that don't fit are skipped in favour of shorter ones further down.
+    Only the first MAX_RANKED results are considered, and only as many are taken off the
+    ranking as it takes to fill max_width.
+    """
+    query = normalize_query(query)
+    ranked = []
+    seen = set()
+    shortest = max_width
+    for i, result in enumerate(results[:MAX_RANKED]):
+        name, key = result.get("name"), result.get("key")
+        priority = TYPE_PRIORITY.get(result.get("type"))
+        if priority is None or not name or key in seen: continue
+        seen.add(key)
+        if len(name) > max_width: continue # Can't be shown however it ranks.
+        shortest = min(shortest, len(name))
+        ranked.append((match_rank(name, query), priority, -uses(key) if uses else 0, i, name, key))
+    heapq.heapify(ranked)
+
+    suggestions = []
+    width = 0
+    while ranked:
+        name, key = heapq.heappop(ranked)[4:]
+        added = len(name) + (len(SEPARATOR) if suggestions else 0)
+        if width + added > max_width:
+            if max_width - width < shortest + len(SEPARATOR): break # Nothing else can fit.
+            continue
+        width += added
+        suggestions.append((name, key))
+    return suggestions
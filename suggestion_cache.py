@@ -0,0 +1,70 @@
+import threading
+from collections import OrderedDict
+
+# searchSuggestions never returns more results than this, so a shorter
+# list is every match there is for that query.
+COMPLETE_RESULT_LIMIT = 10
+
+def normalize_query(query):
+    """ Queries that differ only in case or whitespace get the same suggestions. """
+    return " ".join(query.casefold().split())
+
+def _searchable_text(result):
+    return " ".join(result.get(field) or "" for field in ("name", "artist", "album")).casefold()
+
+class SuggestionCache():
+    """
+    A bounded LRU cache of searchSuggestions results, keyed by normalized query.
+
+    Empty results are cached too. If a query isn't cached but a shorter prefix of it
+    is, and that prefix's results were complete (fewer than COMPLETE_RESULT_LIMIT),
+    the results for the longer query are found by filtering the prefix's results
+    locally instead of asking the API.
+    """
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "prefix_hits": 0, "negative_hits": 0, "misses": 0}
+
+    def get(self, query):
+        """ Return the cached results for query, or None if the API has to be asked. """
+        query = normalize_query(query)
+        with self._lock:
+            results = self._entries.get(query)
+            if results is not None:
+                self._entries.move_to_end(query)
+                self.stats["hits"] += 1
+                if not results: self.stats["negative_hits"] += 1
+                return results
+
+            for end in range(len(query) - 1, 0, -1):
+                prefix_results = self._entries.get(query[:end])
+                if prefix_results is not None and len(prefix_results) < COMPLETE_RESULT_LIMIT:
+                    results = self._filter(prefix_results, query)
+                    self._put(query, results)
+                    self.stats["prefix_hits"] += 1
+                    if not results: self.stats["negative_hits"] += 1
+                    return results
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, query, results):
+        with self._lock:
+            self._put(normalize_query(query), list(results))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _put(self, query, results):
+        self._entries[query] = results
+        self._entries.move_to_end(query)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _filter(self, results, query):
+        """ Keep results whose name, artist or album contain every word of the query. """
+        words = query.split()
+        return [r for r in results if all(w in _searchable_text(r) for w in words)]
@@ -0,0 +1,80 @@
+import threading
+import time
+
+import sublime
+
+sublime3 = int(sublime.version()) >= 3000
+if sublime3:
+    set_timeout_async = sublime.set_timeout_async
+else:
+    set_timeout_async = sublime.set_timeout
+
+# What to do with playback after skipping. TOGGLE flips it, whatever it is.
+PLAY = "play"
+PAUSE = "pause"
+TOGGLE = "playpause"
+
+class TransportQueue():
+    """
+    Coalesces bursts of transport commands (next, previous, play, pause) into one operation.
+
+    Commands less than window seconds apart are merged into a net number of tracks to skip
+    and what to do with playback afterwards. Once window seconds pass without another one,
+    run(skip, playback) is called once, on Sublime's async thread. Five nexts become
+    run(5, None), next then previous cancel out, two toggles cancel out, and the last of
+    play and pause wins.
+    """
+    def __init__(self, run, window=0.1):
+        self.run = run
+        self.window = window
+
+        self._skip = 0
+        self._playback = None # PLAY, PAUSE, TOGGLE or None
+        self._scheduled = False
+        self._last_command = 0
+        self._lock = threading.Lock()
+        self.stats = {"commands": 0, "operations": 0}
+
+    def skip(self, tracks):
+        """ Skip tracks tracks forward, or back if it's negative. """
+        with self._lock:
+            self._skip += tracks
+            self._add()
+
+    def playback(self, action):
+        """ PLAY, PAUSE or TOGGLE, after any skipping. """
+        with self._lock:
+            if action != TOGGLE:
+                self._playback = action
+            elif self._playback is None:
+                self._playback = TOGGLE
+            elif self._playback == TOGGLE:
+                self._playback = None
+            else:
+                self._playback = PAUSE if self._playback == PLAY else PLAY
+            self._add()
+
+    def clear_playback(self):
+        """ Forget about pausing or playing, e.g. because playback is being started another way. """
+        with self._lock:
+            self._playback = None
+
+    def _add(self):
+        self.stats["commands"] += 1
+        self._last_command = time.monotonic()
+        if not self._scheduled:
+            self._scheduled = True
+            set_timeout_async(self._flush, int(self.window * 1000))
+
+    def _flush(self):
+        with self._lock:
+            wait = self._last_command + self.window - time.monotonic()
+            if wait > 0:
+                # Another command came in since this was scheduled.
+                set_timeout_async(self._flush, int(wait * 1000) + 1)
+                return
+            skip, playback = self._skip, self._playback
+            self._skip, self._playback, self._scheduled = 0, None, False
+        if skip or playback:
+            self.stats["operations"] += 1
+            self.run(skip, playback)